@@ -1,188 +1,70 @@
 # Copyright (c) 2018, NVIDIA CORPORATION. All rights reserved.
 # See file LICENSE for terms.
+#
+# Description: Check latency between a client that uses the blocking API,
+# without an event loop, and an asyncio server.
 
 import argparse
-import concurrent.futures
+import asyncio
 import time
 
+import numpy as np
 import ucp
 
-accept_cb_started = False
-new_client_ep = None
 max_msg_log = 23
 max_iters = 1000
 
 
-def talk_to_client(client_ep):
-
-    global args
-    global cb_not_done
-
-    msg_log = max_msg_log
-    iters = max_iters
-    comm_ep = client_ep
-
-    send_buffer_region = ucp.buffer_region()
-    recv_buffer_region = ucp.buffer_region()
-
-    if args.mem_type == "cuda":
-        send_buffer_region.alloc_cuda(1 << msg_log)
-        recv_buffer_region.alloc_cuda(1 << msg_log)
-    else:
-        send_buffer_region.alloc_host(1 << msg_log)
-        recv_buffer_region.alloc_host(1 << msg_log)
-
-    print(
-        "{}\t\t{}\t\t{}\t\t{}".format(
-            "Size (bytes)", "Latency (us)", "Issue (us)", "Progress (us)"
-        )
-    )
-
-    for i in range(msg_log):
-        msg_len = 2 ** i
-
-        warmup_iters = int((0.1 * iters))
-        for j in range(warmup_iters):
-            send_msg = ucp.ucp_msg(send_buffer_region)
-            recv_msg = ucp.ucp_msg(recv_buffer_region)
-            send_req = comm_ep.send(send_msg, msg_len)
-            recv_req = comm_ep.recv(recv_msg, msg_len)
-            send_req.result()
-            recv_req.result()
-
-        send_msg = []
-        recv_msg = []
-        for j in range(iters):
-            send_msg.append(ucp.ucp_msg(send_buffer_region))
-            recv_msg.append(ucp.ucp_msg(recv_buffer_region))
-
-        start = time.time()
-        issue_lat = 0
-        progress_lat = 0
-
-        for j in range(iters):
-
-            tmp_start = time.time()
-            send_req = comm_ep.send(send_msg[j], msg_len)
-            tmp_end = time.time()
-            issue_lat += tmp_end - tmp_start
-
-            tmp_start = time.time()
-            send_req.result()
-            tmp_end = time.time()
-            progress_lat += tmp_end - tmp_start
-
-            tmp_start = time.time()
-            recv_req = comm_ep.recv(recv_msg[j], msg_len)
-            tmp_end = time.time()
-            issue_lat += tmp_end - tmp_start
-
-            tmp_start = time.time()
-            recv_req.result()
-            tmp_end = time.time()
-            progress_lat += tmp_end - tmp_start
-
-        end = time.time()
-        lat = end - start
-        lat = ((lat / 2) / iters) * 1000000
-        issue_lat = ((issue_lat / 2) / iters) * 1000000
-        progress_lat = ((progress_lat / 2) / iters) * 1000000
-        print("{}\t\t{}\t\t{}\t\t{}".format(msg_len, lat, issue_lat, progress_lat))
-
-    if args.mem_type == "cuda":
-        send_buffer_region.free_cuda()
-        recv_buffer_region.free_cuda()
-    else:
-        send_buffer_region.free_host()
-        recv_buffer_region.free_host()
-
-    ucp.destroy_ep(client_ep)
-    cb_not_done = False
+async def talk_to_client(client_ep):
+    """Echo every message back to the client"""
+    warmup_iters = int((0.1 * max_iters))
+    for i in range(max_msg_log):
+        recv_msg = np.empty(2 ** i, dtype=np.uint8)
+        for j in range(warmup_iters + max_iters):
+            await client_ep.recv(recv_msg)
+            await client_ep.send(recv_msg)
+    done.set_result(None)
 
 
 def talk_to_server(ip, port):
+    server_ep = ucp.connect(ip, port)
+    send_msg = np.zeros(1 << max_msg_log, dtype=np.uint8)
+    recv_msg = np.empty(1 << max_msg_log, dtype=np.uint8)
 
-    global args
-
-    msg_log = max_msg_log
-    iters = max_iters
-
-    server_ep = ucp.get_endpoint(ip, port)
-    comm_ep = server_ep
+    print("{}\t\t{}".format("Size (bytes)", "Latency (us)"))
 
-    send_buffer_region = ucp.buffer_region()
-    recv_buffer_region = ucp.buffer_region()
-
-    if args.mem_type == "cuda":
-        send_buffer_region.alloc_cuda(1 << msg_log)
-        recv_buffer_region.alloc_cuda(1 << msg_log)
-    else:
-        send_buffer_region.alloc_host(1 << msg_log)
-        recv_buffer_region.alloc_host(1 << msg_log)
-
-    for i in range(msg_log):
+    warmup_iters = int((0.1 * max_iters))
+    for i in range(max_msg_log):
         msg_len = 2 ** i
 
-        warmup_iters = int((0.1 * iters))
         for j in range(warmup_iters):
-            send_msg = ucp.ucp_msg(send_buffer_region)
-            recv_msg = ucp.ucp_msg(recv_buffer_region)
-            recv_req = comm_ep.recv(recv_msg, msg_len)
-            recv_req.result()
-            send_req = comm_ep.send(send_msg, msg_len)
-            send_req.result()
-
-        send_msg = []
-        recv_msg = []
-        for j in range(iters):
-            send_msg.append(ucp.ucp_msg(send_buffer_region))
-            recv_msg.append(ucp.ucp_msg(recv_buffer_region))
+            server_ep.send_blocking(send_msg[:msg_len])
+            server_ep.recv_blocking(recv_msg[:msg_len])
 
         start = time.time()
-        for j in range(iters):
-            recv_req = comm_ep.recv(recv_msg[j], msg_len)
-            recv_req.result()
-            send_req = comm_ep.send(send_msg[j], msg_len)
-            send_req.result()
+        for j in range(max_iters):
+            server_ep.send_blocking(send_msg[:msg_len])
+            server_ep.recv_blocking(recv_msg[:msg_len])
         end = time.time()
         lat = end - start
-        lat = ((lat / 2) / iters) * 1000000
-
-    if args.mem_type == "cuda":
-        send_buffer_region.free_cuda()
-        recv_buffer_region.free_cuda()
-    else:
-        send_buffer_region.free_host()
-        recv_buffer_region.free_host()
+        lat = ((lat / 2) / max_iters) * 1000000
+        print("{}\t\t{}".format(msg_len, lat))
 
-    ucp.destroy_ep(server_ep)
+    server_ep.close()
 
 
 parser = argparse.ArgumentParser()
 parser.add_argument("-s", "--server", help="enter server ip", required=False)
 parser.add_argument("-p", "--port", help="enter server port number", required=False)
-parser.add_argument("-i", "--intra_node", action="store_true")
-parser.add_argument(
-    "-m", "--mem_type", help="host/cuda (default = host)", required=False
-)
 args = parser.parse_args()
+ucp.init()
 
-## initiate ucp
-init_str = ""
-server = False
-cb_not_done = True
 if args.server is None:
-    server = True
-else:
-    server = False
-    init_str = args.server
-
-ucp.init()
-if server:
-    if args.intra_node:
-        ucp.set_cuda_dev(1)
-    ucp.start_server(talk_to_client, is_coroutine=False)
-    while cb_not_done:
-        ucp.progress()
+    loop = asyncio.get_event_loop()
+    done = loop.create_future()
+    listener = ucp.create_listener(talk_to_client)
+    print("Listening on port %d" % listener.port)
+    loop.run_until_complete(done)
+    loop.close()
 else:
-    talk_to_server(init_str.encode(), int(args.port))
+    talk_to_server(args.server, int(args.port))
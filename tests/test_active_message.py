@@ -0,0 +1,45 @@
+import asyncio
+
+import numpy as np
+import pytest
+import ucp
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [0, 1, 2 ** 10, 2 ** 20])
+async def test_am_send(size):
+    received = asyncio.get_event_loop().create_future()
+
+    def handler(header, payload, ep):
+        received.set_result((bytes(header), np.frombuffer(payload, dtype="u1").copy()))
+
+    ucp.register_am_handler(1, handler)
+    listener = ucp.create_listener(lambda ep: None)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    msg = np.arange(size, dtype="u1")
+    await client.am_send(1, b"header", msg)
+    header, payload = await received
+    assert header == b"header"
+    np.testing.assert_array_equal(payload, msg)
+    ucp.register_am_handler(1, None)
+
+
+@pytest.mark.asyncio
+async def test_am_reply():
+    """The handler replies to the endpoint the request came from"""
+    response = asyncio.get_event_loop().create_future()
+
+    def request_handler(header, payload, ep):
+        asyncio.ensure_future(ep.am_send(2, bytes(header), bytes(payload) * 2))
+
+    def response_handler(header, payload, ep):
+        response.set_result((bytes(header), bytes(payload)))
+
+    ucp.register_am_handler(1, request_handler)
+    ucp.register_am_handler(2, response_handler)
+    listener = ucp.create_listener(lambda ep: None)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    await client.am_send(1, b"req-1", b"ab")
+    assert await response == (b"req-1", b"abab")
+    ucp.register_am_handler(1, None)
+    ucp.register_am_handler(2, None)
@@ -0,0 +1,96 @@
+import asyncio
+import queue
+import threading
+
+import pytest
+import ucp
+
+np = pytest.importorskip("numpy")
+
+
+def start_echo_server(nmsgs):
+    """Starts an asyncio echo server in a thread of its own, returns
+    its port and the thread"""
+    port = queue.Queue()
+
+    async def serve():
+        done = asyncio.get_event_loop().create_future()
+
+        async def echo(ep):
+            for _ in range(nmsgs):
+                msg = await ep.recv_any()
+                await ep.send(msg)
+            done.set_result(None)
+
+        listener = ucp.create_listener(echo)
+        port.put(listener.port)
+        await done
+
+    thread = threading.Thread(target=asyncio.run, args=(serve(),), daemon=True)
+    thread.start()
+    return port.get(), thread
+
+
+@pytest.mark.parametrize("size", [1, 2 ** 20])
+def test_send_recv_blocking(size):
+    ucp.reset()
+    try:
+        port, server = start_echo_server(3)
+        ep = ucp.connect(ucp.get_address(), port)
+        for i in range(3):
+            msg = np.arange(size, dtype="u1") + i
+            resp = np.empty_like(msg)
+            ep.send_blocking(msg)
+            ep.recv_blocking(resp)
+            np.testing.assert_array_equal(resp, msg)
+        server.join()
+        ep.close()
+    finally:
+        ucp.reset()
+
+
+def test_close_blocking():
+    ucp.reset()
+    closed = threading.Event()
+    port = queue.Queue()
+
+    async def serve():
+        done = asyncio.get_event_loop().create_future()
+
+        async def echo(ep):
+            await ep.send(await ep.recv_any())
+            # Keep progressing until the client has closed, which flushes
+            # the endpoint thus needs the peer
+            await asyncio.get_event_loop().run_in_executor(None, closed.wait)
+            done.set_result(None)
+
+        listener = ucp.create_listener(echo)
+        port.put(listener.port)
+        await done
+
+    server = threading.Thread(target=asyncio.run, args=(serve(),), daemon=True)
+    server.start()
+    try:
+        ep = ucp.connect(ucp.get_address(), port.get())
+        msg = np.arange(10, dtype="u1")
+        resp = np.empty_like(msg)
+        ep.send_blocking(msg)
+        ep.recv_blocking(resp)
+        np.testing.assert_array_equal(resp, msg)
+        # Nothing would progress the worker of the endpoint while awaiting
+        with pytest.raises(ucp.exceptions.UCXError, match="close_blocking"):
+            asyncio.run(ep.aclose())
+        ep.close_blocking()
+        assert ep.closed()
+    finally:
+        closed.set()
+        server.join()
+        ucp.reset()
+
+
+@pytest.mark.asyncio
+async def test_blocking_needs_connect():
+    listener = ucp.create_listener(lambda ep: None)
+    ep = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    with pytest.raises(ucp.exceptions.UCXError):
+        ep.send_blocking(b"message")
@@ -0,0 +1,123 @@
+import asyncio
+
+import numpy as np
+import pytest
+import ucp
+
+
+def make_server():
+    """Returns a listener that echoes a message on each connection and
+    the list of the server endpoints"""
+    server_eps = []
+
+    async def server_node(ep):
+        server_eps.append(ep)
+        msg = np.empty(10, dtype="u1")
+        while True:
+            try:
+                await ep.recv(msg)
+                await ep.send(msg)
+            except (ucp.exceptions.UCXCanceled, ucp.exceptions.UCXCloseError):
+                return
+
+    return ucp.create_listener(server_node), server_eps
+
+
+async def echo(ep):
+    msg = np.arange(10, dtype="u1")
+    resp = np.empty_like(msg)
+    await ep.send(msg)
+    await ep.recv(resp)
+    np.testing.assert_array_equal(resp, msg)
+
+
+@pytest.mark.asyncio
+async def test_reuse():
+    listener, server_eps = make_server()
+    pool = ucp.ConnectionPool()
+    address = (ucp.get_address(), listener.port)
+
+    ep = await pool.acquire(*address)
+    await echo(ep)
+    pool.release(ep)
+    assert len(pool) == 1
+    async with pool.connection(*address) as ep2:
+        assert ep2 is ep
+        assert len(pool) == 0
+        await echo(ep2)
+    assert len(pool) == 1
+    assert len(server_eps) == 1
+
+    await pool.close()
+    assert ep.closed()
+    assert len(pool) == 0
+    with pytest.raises(ucp.exceptions.UCXCloseError):
+        await pool.acquire(*address)
+
+
+@pytest.mark.asyncio
+async def test_eviction():
+    listener, server_eps = make_server()
+    pool = ucp.ConnectionPool(max_size=1)
+    address = (ucp.get_address(), listener.port)
+
+    eps = [await pool.acquire(*address) for _ in range(2)]
+    for ep in eps:
+        pool.release(ep)
+    # The pool is full, the longest idle endpoint is shut down
+    assert len(pool) == 1
+    await asyncio.sleep(0.1)
+    assert eps[0].closed()
+    assert await pool.acquire(*address) is eps[1]
+    pool.release(eps[1])
+    await pool.close()
+
+    # Endpoints idle for longer than `idle_timeout` are shut down
+    pool = ucp.ConnectionPool(idle_timeout=0)
+    ep = await pool.acquire(*address)
+    pool.release(ep)
+    ep2 = await pool.acquire(*address)
+    assert ep2 is not ep
+    await echo(ep2)
+    await asyncio.sleep(0.1)
+    assert ep.closed()
+    pool.release(ep2)
+    await pool.close()
+
+    # even if the pool isn't used in the meantime
+    pool = ucp.ConnectionPool(idle_timeout=0.1)
+    ep = await pool.acquire(*address)
+    pool.release(ep)
+    assert len(pool) == 1
+    await asyncio.sleep(0.5)
+    assert len(pool) == 0
+    assert ep.closed()
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_health_check():
+    listener, server_eps = make_server()
+    checked = []
+
+    async def health_check(ep):
+        checked.append(ep)
+        return False
+
+    pool = ucp.ConnectionPool(health_check=health_check)
+    address = (ucp.get_address(), listener.port)
+
+    ep = await pool.acquire(*address)
+    pool.release(ep)
+    ep2 = await pool.acquire(*address)
+    assert checked == [ep]
+    assert ep2 is not ep
+    # Endpoints are shut down rather than reused after an error
+    with pytest.raises(ZeroDivisionError):
+        async with pool.connection(*address) as ep3:
+            1 / 0
+    assert len(pool) == 0
+    await asyncio.sleep(0.1)
+    assert ep.closed() and ep3.closed()
+    pool.release(ep2)
+    await pool.close()
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+import ucp
+
+
+@pytest.mark.asyncio
+async def test_peer_info():
+    server_info = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        server_info.set_result(ep.peer_info)
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    for info in (client.peer_info, await server_info):
+        assert info["version"] == ucp._libs.core.PROTOCOL_VERSION
+        assert info["cuda_support"] == client.cuda_support()
+        assert info["progress_mode"] in ("blocking", "spin", "thread")
+        assert isinstance(info["max_eager_size"], int)
+    # Both ends are in this process
+    assert client.peer_info["peer_id"] == (await server_info)["peer_id"]
+
+
+@pytest.mark.asyncio
+async def test_version_mismatch(monkeypatch):
+    listener = ucp.create_listener(lambda ep: None)
+    # The listener and the client share the info, both send the version
+    handshake_info = ucp.public_api._get_ctx().handshake_info
+    monkeypatch.setitem(handshake_info, "version", 99)
+    # The listener rejects the client, which is told so
+    with pytest.raises(ucp.exceptions.UCXError, match="rejected ours"):
+        await asyncio.wait_for(
+            ucp.create_endpoint(ucp.get_address(), listener.port), timeout=10
+        )
+
+
+@pytest.mark.asyncio
+async def test_tags():
+    from ucp._libs.core import TAG_STREAM_MASK
+
+    server_eps = []
+
+    async def server_node(ep):
+        server_eps.append(ep)
+
+    listener = ucp.create_listener(server_node)
+    clients = [
+        await ucp.create_endpoint(ucp.get_address(), listener.port) for _ in range(10)
+    ]
+    while len(server_eps) < len(clients):
+        await asyncio.sleep(0.01)
+    # Every endpoint receives on tags of its own
+    eps = [ep._ep for ep in clients + server_eps]
+    assert len({ep._tag for ep in eps}) == len(eps)
+    for ep in eps:
+        assert ep._tag & TAG_STREAM_MASK == 0
+        assert ep._recv_tag & ~TAG_STREAM_MASK == ep._tag
+    # and sends on the tags of its peer
+    for client in clients:
+        server = next(ep for ep in server_eps if ep._ep._tag == client._ep._peer_tag)
+        assert server._ep._peer_tag == client._ep._tag
+        assert server._ep._send_tag == client._ep._recv_tag
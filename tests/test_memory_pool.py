@@ -0,0 +1,65 @@
+import asyncio
+
+import numpy as np
+import pytest
+import ucp
+
+
+def test_allocate():
+    pool = ucp.MemoryPool(slab_size=2 ** 16, min_block_size=2 ** 8)
+    buf = pool.allocate(1000)
+    assert len(buf) == buf.nbytes == 1000
+    ary = np.asarray(buf)
+    ary[:] = np.arange(1000) % 256
+    np.testing.assert_array_equal(np.frombuffer(memoryview(buf), dtype="u1"), ary)
+    assert pool.nslabs == 1
+
+
+def test_reuse():
+    pool = ucp.MemoryPool(slab_size=2 ** 16, min_block_size=2 ** 8)
+    buf = pool.allocate(2 ** 16)
+    addr = buf.__array_interface__["data"][0]
+    del buf
+    buf = pool.allocate(2 ** 15 + 1)
+    assert buf.__array_interface__["data"][0] == addr
+    assert pool.nslabs == 1
+
+
+def test_size_classes_share_slabs():
+    pool = ucp.MemoryPool(slab_size=2 ** 16, min_block_size=2 ** 8)
+    bufs = [pool.allocate(2 ** i) for i in range(8, 15)]
+    assert pool.nslabs == 1
+    # The 32 KiB left don't fit a block of the largest size class
+    bufs.append(pool.allocate(2 ** 16))
+    assert pool.nslabs == 2
+    addrs = [b.__array_interface__["data"][0] for b in bufs]
+    assert len(set(addrs)) == len(addrs)
+
+
+def test_min_block_size():
+    with pytest.raises(ValueError):
+        ucp.MemoryPool(min_block_size=1)
+
+
+def test_oversize():
+    pool = ucp.MemoryPool(slab_size=2 ** 16, min_block_size=2 ** 8)
+    buf = pool.allocate(2 ** 17)
+    assert len(buf) == 2 ** 17
+    assert pool.nslabs == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [1, 2 ** 10, 2 ** 20, 2 ** 25])
+async def test_send_recv_pooled(size):
+    pool = ucp.MemoryPool(slab_size=2 ** 24)
+    received = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        received.set_result(await ep.recv_any(pool.allocate))
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    msg = pool.allocate(size)
+    np.asarray(msg)[:] = np.arange(size) % 256
+    await client.send(msg)
+    np.testing.assert_array_equal(np.asarray(await received), np.asarray(msg))
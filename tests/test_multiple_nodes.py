@@ -47,3 +47,36 @@ async def test_one_server_many_clients():
     for _ in range(100):
         clients.append(client_node(lf.port))
     await asyncio.gather(*clients, loop=asyncio.get_event_loop())
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("concurrency", [None, 2])
+async def test_create_endpoints(concurrency):
+    async def server_node(ep):
+        msg = np.empty(1, dtype=np.int64)
+        await ep.recv(msg)
+        await ep.send(msg)
+
+    listeners = [ucp.create_listener(server_node) for _ in range(3)]
+    addresses = [(ucp.get_address(), lf.port) for lf in listeners] * 2
+    eps = await ucp.create_endpoints(addresses, concurrency=concurrency)
+    assert len(eps) == len(addresses)
+    for i, ep in enumerate(eps):
+        msg = np.array([i], dtype=np.int64)
+        resp = np.empty_like(msg)
+        await ep.send(msg)
+        await ep.recv(resp)
+        np.testing.assert_array_equal(resp, msg)
+
+
+@pytest.mark.asyncio
+async def test_create_endpoints_failure():
+    listener = ucp.create_listener(lambda ep: None)
+    # A port that doesn't fit 16 bits fails before connecting
+    addresses = [(ucp.get_address(), listener.port), (ucp.get_address(), -1)]
+    eps = await ucp.create_endpoints(addresses, return_exceptions=True)
+    assert isinstance(eps[0], ucp.Endpoint)
+    assert isinstance(eps[1], OverflowError)
+
+    with pytest.raises(ucp.exceptions.UCXError, match="1 of 2 peers"):
+        await ucp.create_endpoints(addresses)
@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+
+import pytest
+import ucp
+
+np = pytest.importorskip("numpy")
+
+
+async def send_recv(size):
+    msg = np.arange(size, dtype="u1")
+    received = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        buf = np.empty_like(msg)
+        await ep.recv(buf)
+        received.set_result(buf)
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    await client.send(msg)
+    np.testing.assert_array_equal(await received, msg)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [10, 2 ** 20])
+@pytest.mark.parametrize("progress_mode", ["spin", "thread"])
+async def test_progress_mode(progress_mode, size):
+    ucp.reset()
+    ucp.init(progress_mode=progress_mode)
+    try:
+        await send_recv(size)
+    finally:
+        ucp.reset()
+
+
+@pytest.mark.asyncio
+async def test_spin_then_block():
+    ucp.reset()
+    ucp.init(progress_mode="spin", spin_time=0.05)
+    try:
+        await send_recv(10)
+        # Once idle for `spin_time`, the event loop stops polling
+        # and waits on the epoll fd without using any CPU
+        await asyncio.sleep(0.1)
+        start = time.process_time()
+        await asyncio.sleep(0.5)
+        assert time.process_time() - start < 0.1
+    finally:
+        ucp.reset()
+
+
+@pytest.mark.asyncio
+async def test_progress_budget():
+    ucp.reset()
+    ucp.init(progress_mode="blocking", progress_budget=1)
+    try:
+        msgs = [np.arange(i, dtype="u1") for i in range(1, 101)]
+        received = asyncio.get_event_loop().create_future()
+
+        async def server_node(ep):
+            bufs = [np.empty_like(m) for m in msgs]
+            await ep.recv_many(bufs)
+            received.set_result(bufs)
+
+        listener = ucp.create_listener(server_node)
+        client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+        await client.send_many(msgs)
+        for resp, msg in zip(await received, msgs):
+            np.testing.assert_array_equal(resp, msg)
+        stats = ucp.get_progress_stats()
+        assert stats["budget_exhausted_count"] > 0
+        assert stats["progress_calls"] <= stats["progress_count"]
+    finally:
+        ucp.reset()
+
+
+def test_unknown_progress_mode():
+    ucp.reset()
+    with pytest.raises(ValueError):
+        ucp.init(progress_mode="unknown")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("progress_mode", ["blocking", "thread"])
+async def test_num_workers(progress_mode):
+    ucp.reset()
+    ucp.init(progress_mode=progress_mode, num_workers=3)
+    try:
+        # The listeners and endpoints land on different workers
+        for size in (10, 2 ** 20):
+            await send_recv(size)
+    finally:
+        ucp.reset()
+
+
+@pytest.mark.parametrize("progress_mode", ["blocking", "thread"])
+def test_worker_per_event_loop(progress_mode):
+    ucp.reset()
+    ucp.init(progress_mode=progress_mode)
+    workers = {}
+
+    def run(name):
+        async def main():
+            for size in (10, 2 ** 20):
+                await send_recv(size)
+            workers[name] = ucp.get_ucp_worker()
+
+        # Each thread runs an event loop of its own
+        asyncio.run(main())
+
+    try:
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(workers) == 2
+        assert workers[0] != workers[1]
+    finally:
+        ucp.reset()
@@ -0,0 +1,86 @@
+import asyncio
+
+import numpy as np
+import pytest
+import ucp
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [1, 2 ** 10, 2 ** 20])
+async def test_get(size):
+    data = np.arange(size, dtype="u1")
+    region = ucp.register_memory(data)
+
+    async def server_node(ep):
+        await ep.send_rkey(region)
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    remote_addr, nbytes, rkey = await client.recv_rkey()
+    assert nbytes == data.nbytes
+    resp = np.empty_like(data)
+    await client.get(resp, remote_addr, rkey)
+    np.testing.assert_array_equal(resp, data)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [1, 2 ** 10, 2 ** 20])
+async def test_put(size):
+    data = np.zeros(size, dtype="u1")
+    region = ucp.register_memory(data)
+
+    async def server_node(ep):
+        await ep.send_rkey(region)
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    remote_addr, nbytes, rkey = await client.recv_rkey()
+    msg = np.arange(size, dtype="u1") + 1
+    await client.put(msg, remote_addr, rkey)
+    # The put has only completed locally, wait for it to reach `data`
+    for _ in range(1000):
+        if np.array_equal(data, msg):
+            break
+        ucp.progress()
+        await asyncio.sleep(0.001)
+    np.testing.assert_array_equal(data, msg)
+
+
+@pytest.mark.asyncio
+async def test_atomics():
+    counter = np.zeros(1, dtype=np.uint64)
+    region = ucp.register_memory(counter)
+
+    async def server_node(ep):
+        await ep.send_rkey(region)
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    remote_addr, _, rkey = await client.recv_rkey()
+
+    assert await client.fetch_add(remote_addr, rkey, 5) == 0
+    assert await client.fetch_add(remote_addr, rkey, 1) == 5
+    assert counter[0] == 6
+
+    # A failing and a succeeding compare-and-swap
+    assert await client.compare_swap(remote_addr, rkey, 0, 42) == 6
+    assert counter[0] == 6
+    assert await client.compare_swap(remote_addr, rkey, 6, 42) == 6
+    assert counter[0] == 42
+
+    client.atomic_add(remote_addr, rkey, 2)
+    assert await client.fetch_add(remote_addr, rkey, 0) in (42, 44)
+    for _ in range(1000):
+        if counter[0] == 44:
+            break
+        ucp.progress()
+        await asyncio.sleep(0.001)
+    assert counter[0] == 44
+
+
+def test_register_readonly():
+    readonly = np.zeros(64, dtype="u1")
+    readonly.flags.writeable = False
+    for buffer in (bytes(64), readonly):
+        with pytest.raises(ValueError, match="read-only"):
+            ucp.register_memory(buffer)
@@ -119,3 +119,354 @@ async def test_send_recv_numba(size, dtype):
     resp = cuda.device_array_like(msg)
     await client.recv(resp)
     np.testing.assert_array_equal(np.array(resp), np.array(msg))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("nbuffers", [1, 10, 100])
+async def test_send_recv_many(nbuffers):
+    asyncio.get_event_loop().set_exception_handler(handle_exception)
+
+    msgs = [np.arange(i + 1, dtype="<i8") for i in range(nbuffers)]
+    received = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        bufs = [np.empty_like(m) for m in msgs]
+        await ep.recv_many(bufs)
+        received.set_result(bufs)
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    await client.send_many(msgs)
+    for resp, msg in zip(await received, msgs):
+        np.testing.assert_array_equal(resp, msg)
+
+
+@pytest.mark.asyncio
+async def test_recv_many_rejects_whole_batch():
+    from ucp._libs.send_recv import tag_recv_many
+
+    listener = ucp.create_listener(lambda ep: None)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    ep = client._ep
+    nlive = len(ep._inflight)
+    # The read-only buffer comes last, the first must not be posted either
+    bufs = [bytearray(8), b"readonly"]
+    with pytest.raises(ValueError):
+        tag_recv_many(ep._ucp_worker, bufs, [8, 8], ep._recv_tag, registry=ep._inflight)
+    assert len(ep._inflight) == nlive
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", msg_sizes)
+async def test_send_recv_iov(size):
+    asyncio.get_event_loop().set_exception_handler(handle_exception)
+
+    frames = [np.arange(size, dtype="<i8"), b"header", np.ones(size, dtype="u1")]
+    received = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        # Use a different partitioning than the sender
+        msg = np.empty(sum(memoryview(f).nbytes for f in frames), dtype="u1")
+        split = len(msg) // 2
+        await ep.recv_iov([msg[:split], msg[split:]])
+        received.set_result(msg)
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    await client.send_iov(frames)
+    expect = np.concatenate([np.frombuffer(f, dtype="u1") for f in frames])
+    np.testing.assert_array_equal(await received, expect)
+
+
+@pytest.mark.asyncio
+async def test_recv_any():
+    asyncio.get_event_loop().set_exception_handler(handle_exception)
+
+    msgs = [np.arange(size, dtype="u1") for size in msg_sizes]
+    received = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        bufs = []
+        for _ in msgs:
+            bufs.append(await ep.recv_any(lambda n: np.empty(n, dtype="u1")))
+        received.set_result(bufs)
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    for msg in msgs:
+        await client.send(msg)
+    for resp, msg in zip(await received, msgs):
+        np.testing.assert_array_equal(resp, msg)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [8, 2 ** 20])
+async def test_recv_any_allocator_raises(size):
+    asyncio.get_event_loop().set_exception_handler(handle_exception)
+
+    def failing_allocator(n):
+        raise MemoryError("no memory for %d bytes" % n)
+
+    received = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        with pytest.raises(MemoryError):
+            await ep.recv_any(failing_allocator)
+        # The failed message is discarded, the next one is received
+        received.set_result(await ep.recv_any(bytearray))
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    await client.send(np.zeros(size, dtype="u1"))
+    await client.send(np.arange(16, dtype="u1"))
+    resp = await asyncio.wait_for(received, 10)
+    np.testing.assert_array_equal(np.frombuffer(resp, "u1"), np.arange(16))
+
+
+@pytest.mark.asyncio
+async def test_inflight_registry_is_bounded():
+    asyncio.get_event_loop().set_exception_handler(handle_exception)
+
+    n = 1000
+    received = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        msg = np.empty(1, dtype="u1")
+        for _ in range(n):
+            await ep.recv(msg)
+        received.set_result(ep)
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    for _ in range(n):
+        await client.send(np.zeros(1, dtype="u1"))
+    server_ep = await received
+    for ep in (client, server_ep):
+        # Only the posted shutdown receive is left in flight
+        assert len(ep._ep._inflight) == 1
+        assert ep._ep._inflight.capacity() < 10
+
+
+@pytest.mark.parametrize(
+    "make_buffer",
+    [
+        bytes,
+        bytearray,
+        lambda n: memoryview(bytearray(n)),
+        lambda n: np.empty(n // 8, dtype="<i8"),
+    ],
+)
+def test_buffer_array(make_buffer):
+    from ucp._libs.utils import Array
+
+    buffer = make_buffer(64)
+    arr = Array(buffer)
+    mview = memoryview(buffer)
+    assert arr.nbytes == 64
+    assert arr.writable == (not mview.readonly)
+    assert not arr.cuda
+    assert arr.ptr == np.frombuffer(mview, dtype="u1").ctypes.data
+    assert arr.contiguous
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "make_strided",
+    [
+        lambda a: a[:, 1],  # A column
+        lambda a: a[1:, ::2],  # Every other column
+        lambda a: a.T,  # Fortran order
+        lambda a: a[::-1, 2:],  # Negative strides
+    ],
+)
+# Rows of 5 elements are packed, rows of 1024 are sent segment by segment
+@pytest.mark.parametrize("ncols", [5, 1024])
+async def test_send_recv_strided(make_strided, ncols):
+    asyncio.get_event_loop().set_exception_handler(handle_exception)
+
+    msg = make_strided(np.arange(64 * ncols, dtype="<i8").reshape(64, ncols))
+    received = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        # Receive into a contiguous array and then into a strided one
+        contig = np.empty(msg.shape, dtype=msg.dtype)
+        await ep.recv(contig)
+        strided = make_strided(np.zeros((64, ncols), dtype=msg.dtype))
+        await ep.recv(strided)
+        received.set_result((contig, strided))
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    await client.send(msg)
+    await client.send(np.ascontiguousarray(msg))
+    for resp in await received:
+        np.testing.assert_array_equal(resp, msg)
+
+
+@pytest.mark.asyncio
+async def test_send_recv_many_mixed():
+    asyncio.get_event_loop().set_exception_handler(handle_exception)
+
+    matrix = np.arange(64 * 5, dtype="<i8").reshape(64, 5)
+    msgs = [np.arange(8, dtype="<i8"), matrix[:, 1], matrix.T, b"tail"]
+    received = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        # Strided receive buffers for contiguous messages and vice versa
+        bufs = [
+            np.zeros((8, 2), dtype="<i8")[:, 0],
+            np.empty(64, dtype="<i8"),
+            np.zeros((5, 64), dtype="<i8"),
+            bytearray(4),
+        ]
+        await ep.recv_many(bufs)
+        received.set_result(bufs)
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    await client.send_many(msgs)
+    resps = await received
+    for resp, msg in zip(resps[:3], msgs[:3]):
+        np.testing.assert_array_equal(resp, msg)
+    assert resps[3] == msgs[3]
+    # Only the posted shutdown receive is left in flight
+    assert len(client._ep._inflight) == 1
+
+
+@pytest.mark.asyncio
+async def test_operation_is_awaitable():
+    from ucp._libs.send_recv import tag_send
+
+    asyncio.get_event_loop().set_exception_handler(handle_exception)
+
+    msg = np.arange(10, dtype="u1")
+    received = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        buf = np.empty_like(msg)
+        await ep.recv(buf)
+        # A receive that never completes, its task is canceled
+        task = asyncio.ensure_future(ep.recv(np.empty_like(msg)))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        received.set_result(buf)
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    # The operations work where asyncio expects futures
+    ep = client._ep
+    op = tag_send(ep._ucp_endpoint, msg, msg.nbytes, ep._send_tag)
+    assert await asyncio.gather(op) == [True]
+    assert op.done() and op.result() is True
+    np.testing.assert_array_equal(await received, msg)
+
+
+@pytest.mark.asyncio
+async def test_operation_cancel():
+    asyncio.get_event_loop().set_exception_handler(handle_exception)
+
+    done = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        # Never sends anything, so the receives of the client never complete
+        await done
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    buf = np.empty(10, dtype="u1")
+
+    op = client._ep._recv(buf, buf.nbytes)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(op, 0.1)
+    assert op.cancelled()
+
+    # Canceling the gathering cancels the operation
+    op = client._ep._recv(buf, buf.nbytes)
+    gathered = asyncio.gather(op)
+    await asyncio.sleep(0)
+    gathered.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await gathered
+    assert op.cancelled()
+
+    # Canceling the operation cancels the gathering
+    op = client._ep._recv(buf, buf.nbytes)
+    gathered = asyncio.gather(op)
+    await asyncio.sleep(0)
+    op.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await gathered
+    done.set_result(None)
+
+
+@pytest.mark.asyncio
+async def test_recv_after_timeout():
+    asyncio.get_event_loop().set_exception_handler(handle_exception)
+
+    timed_out = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        await timed_out
+        await ep.send(np.arange(10, dtype="u1"))
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    buf = np.empty(10, dtype="u1")
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(client.recv(buf), 0.1)
+    timed_out.set_result(None)
+    # The message goes to the receive made after the timeout
+    resp = np.empty(10, dtype="u1")
+    await asyncio.wait_for(client.recv(resp), 10)
+    np.testing.assert_array_equal(resp, np.arange(10, dtype="u1"))
+
+
+@pytest.mark.asyncio
+async def test_channels():
+    asyncio.get_event_loop().set_exception_handler(handle_exception)
+
+    nchannels = 4
+    received = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        async def echo(channel):
+            msg = np.empty(10, dtype="<i8")
+            await channel.recv(msg)
+            await channel.send(msg)
+
+        # The channels answer in the reverse order of their numbers
+        channels = [ep.channel(n) for n in range(nchannels)]
+        await asyncio.gather(*[echo(c) for c in reversed(channels)])
+        received.set_result(ep)
+
+    listener = ucp.create_listener(server_node)
+    client = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    assert client.channel(0) is client
+    assert client.channel(1) is client.channel(1)
+
+    async def send_recv(n):
+        msg = np.arange(10, dtype="<i8") + n
+        resp = np.empty_like(msg)
+        channel = client.channel(n)
+        await channel.send(msg)
+        await channel.recv(resp)
+        np.testing.assert_array_equal(resp, msg)
+
+    await asyncio.gather(*[send_recv(n) for n in range(nchannels)])
+    await received
+
+    # Closing a channel leaves the connection open
+    channel = client.channel(1)
+    recv = asyncio.ensure_future(channel.recv(np.empty(10, dtype="<i8")))
+    await asyncio.sleep(0)
+    channel.close()
+    with pytest.raises(ucp.exceptions.UCXCanceled):
+        await recv
+    assert channel.closed() and not client.closed()
+    assert client.channel(1) is not channel
+    # Closing the endpoint closes its channels
+    channel = client.channel(2)
+    client.close()
+    assert channel.closed()
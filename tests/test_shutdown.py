@@ -88,3 +88,42 @@ async def test_listener_del():
     assert listener.closed() is False
     del listener
     await ep.send(np.arange(100, dtype=np.int64))
+
+
+@pytest.mark.asyncio
+async def test_flush_and_aclose():
+    """The client flushes and closes without waiting for a reply"""
+    msg = np.arange(10 ** 6, dtype=np.uint8)
+    received = asyncio.get_event_loop().create_future()
+
+    async def server_node(ep):
+        buf = np.empty_like(msg)
+        await ep.recv(buf)
+        received.set_result(buf)
+
+    listener = ucp.create_listener(server_node)
+    ep = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    await ep.send(msg)
+    await ep.flush()
+    await ep.aclose()
+    assert ep.closed()
+    with pytest.raises(ucp.exceptions.UCXCloseError):
+        await ep.aclose()
+    np.testing.assert_array_equal(await received, msg)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("close", ["close", "aclose"])
+async def test_force_close(close):
+    """The client tears the endpoint down with a receive in flight"""
+    listener = ucp.create_listener(lambda ep: None)
+    ep = await ucp.create_endpoint(ucp.get_address(), listener.port)
+    recv = asyncio.ensure_future(ep.recv(np.empty(10, dtype=np.uint8)))
+    await asyncio.sleep(0)
+    if close == "close":
+        ep.close(force=True)
+    else:
+        await ep.aclose(force=True)
+    assert ep.closed()
+    with pytest.raises(ucp.exceptions.UCXCanceled):
+        await recv
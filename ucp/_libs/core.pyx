@@ -2,11 +2,19 @@
 # See file LICENSE for terms.
 # cython: language_level=3
 
+import array
 import asyncio
+import itertools
 from libc.stdint cimport uint64_t
 import uuid
 import socket
+import struct
 import logging
+import os
+import re
+import threading
+import time
+import weakref
 from core_dep cimport *
 from ..exceptions import (
     UCXError,
@@ -16,8 +24,40 @@ from ..exceptions import (
     UCXConfigError,
 )
 
-from .send_recv import tag_send, tag_recv, stream_send, stream_recv
-from .utils import get_buffer_nbytes
+from .send_recv import (
+    tag_send,
+    tag_recv,
+    tag_send_many,
+    tag_recv_many,
+    tag_send_iov,
+    tag_recv_iov,
+    tag_recv_any,
+    tag_probe_waiters,
+    has_probe_waiters,
+    ep_close_wait,
+    has_close_waiters,
+    check_close_waiters,
+    cancel_close_waiters,
+    process_completions,
+    stream_send,
+    stream_recv,
+    ep_flush,
+    rma_put,
+    rma_get,
+    rkey_unpack,
+    am_send,
+    RequestRegistry,
+    atomic_add,
+    atomic_fetch_add,
+    atomic_compare_swap,
+    start_deferring,
+    stop_deferring,
+    is_deferred,
+    call_deferrable,
+    take_deferred,
+    run_deferred,
+)
+from .utils import get_buffer_array
 
 
 cdef assert_ucs_status(ucs_status_t status, msg_context=None):
@@ -82,16 +122,282 @@ def get_config():
     return ret
 
 
-cdef struct _listener_callback_args:
-    ucp_worker_h ucp_worker
-    PyObject *py_config
-    PyObject *py_func
+# The public Endpoints of this process by their UCX endpoint handle,
+# which makes it possible to give active message handlers the endpoint
+# a message came from.
+_endpoints = weakref.WeakValueDictionary()
+
+# The active message header is prefixed with its length
+_am_header_fmt = struct.Struct("Q")
+
+
+def _handle_am(callback, msg, reply_ep, data=None):
+    try:
+        header_nbytes = _am_header_fmt.unpack_from(msg)[0]
+        header_end = _am_header_fmt.size + header_nbytes
+        callback(
+            msg[_am_header_fmt.size:header_end],
+            msg[header_end:],
+            _endpoints.get(reply_ep)
+        )
+    except Exception as e:
+        logging.error("Ignored except in active message handler: %s %s" % (
+            type(e), e)
+        )
+    finally:
+        if data is not None:
+            data.release()
+
+
+# Like the completions of requests, see send_recv.pyx, the UCX callbacks
+# of listeners and active messages don't touch Python. They record an
+# event in the ring buffer of the calling thread, which the thread
+# handles by calling `_process_events()` after progressing a worker.
+# Thus workers can be progressed without the GIL, which the callbacks
+# would otherwise need while UCX holds the lock of the worker.
+cdef extern from *:
+    """
+    static __thread c_util_completion_ring_t ucxpy_events;
+    """
+    c_util_completion_ring_t ucxpy_events
+
+cdef enum:
+    _LISTENER_EVENT
+    _AM_EVENT
+
+
+# What UCX hands to `_am_callback()`, one for each handler of a worker
+cdef struct _AmHandlerArg:
+    PyObject *worker
+    size_t am_id
+
+
+# An active message handed over by `_am_callback()`. Its data is either
+# kept by UCX or, if UCX doesn't allow that, copied to follow the event.
+cdef struct _AmEvent:
+    PyObject *worker
+    size_t am_id
+    ucp_ep_h reply_ep
+    void *data
+    size_t length
+    bint ucx_data
+
+
+cdef class _Worker
+
+
+cdef class _AmData:
+    """The data of an active message, which is freed or given back to
+    UCX once its handler has returned"""
+    cdef:
+        _AmEvent *ev
+        _Worker worker
+
+    def release(self):
+        cdef _AmEvent *ev = self.ev
+        if ev == NULL:
+            return
+        self.ev = NULL
+        # The data of UCX is gone along with a destroyed worker
+        if ev.ucx_data and self.worker.initiated:
+            ucp_am_data_release(self.worker.worker, ev.data)
+        free(ev)
+
+    def __dealloc__(self):
+        # E.g. the event loop the handler was deferred to has been closed
+        self.release()
+
+
+cdef _handle_am_event(_AmEvent *ev):
+    cdef _Worker worker = <_Worker> ev.worker
+    cdef _AmData data = _AmData()
+    data.ev = ev
+    data.worker = worker
+    callback = worker.am_handlers.get(ev.am_id)
+    if callback is None:
+        logging.debug("Dropped active message of unhandled id %d" % ev.am_id)
+        data.release()
+        return
+    msg = PyMemoryView_FromMemory(<char*> ev.data, ev.length, PyBUF_READ)
+    call_deferrable(_handle_am, callback, msg,
+                    PyLong_FromVoidPtr(<void*> ev.reply_ep), data)
+
+
+cdef ucs_status_t _am_callback(void *arg, void *data, size_t length,
+                               ucp_ep_h reply_ep, unsigned flags) nogil:
+    cdef _AmHandlerArg *a = <_AmHandlerArg*> arg
+    cdef bint ucx_data = flags & UCP_CB_PARAM_FLAG_DATA
+    cdef _AmEvent *ev
+    if ucx_data:
+        # UCX keeps the data until `ucp_am_data_release()`
+        ev = <_AmEvent*> malloc(sizeof(_AmEvent))
+    else:
+        # The data is only valid until we return
+        ev = <_AmEvent*> malloc(sizeof(_AmEvent) + length)
+    if ev != NULL:
+        ev.worker = a.worker
+        ev.am_id = a.am_id
+        ev.reply_ep = reply_ep
+        ev.length = length
+        ev.ucx_data = ucx_data
+        if ucx_data:
+            ev.data = data
+        else:
+            ev.data = <char*> ev + sizeof(_AmEvent)
+            memcpy(ev.data, data, length)
+        if not c_util_completion_ring_push(&ucxpy_events, ev, UCS_OK,
+                                           length, _AM_EVENT):
+            return UCS_INPROGRESS if ucx_data else UCS_OK
+        free(ev)
+    # Out of memory, handle a copy of the message right away
+    _handle_am_copy_with_gil(a, data, length, reply_ep)
+    return UCS_OK
+
+
+# Like `_complete_request_with_gil()` in send_recv.pyx, kept out of the
+# nogil callback so that it only takes the GIL when it is called
+cdef void _handle_am_copy_with_gil(_AmHandlerArg *a, void *data,
+                                   size_t length, ucp_ep_h reply_ep) with gil:
+    callback = (<_Worker> a.worker).am_handlers.get(a.am_id)
+    if callback is not None:
+        msg = memoryview((<char*> data)[:length])
+        call_deferrable(_handle_am, callback, msg,
+                        PyLong_FromVoidPtr(<void*> reply_ep))
+
+
+# The version of the connection protocol, peers that speak different
+# versions refuse to connect to each other
+PROTOCOL_VERSION = 2
+
+# Starts every handshake, which tells it apart from the bare tags
+# that peers older than the versioned handshake send
+cdef uint64_t _HANDSHAKE_MAGIC = 0x5543585059485331
+
+_PROGRESS_MODES = ("blocking", "spin", "thread")
+
+# A tag is the id of the endpoint that receives it in the upper bits
+# and a stream of that endpoint in the lower `TAG_STREAM_BITS` bits.
+# `TAG_STREAM_MASK` is the width of that stream field, which bounds the
+# number of streams of an endpoint. Each side of a connection allocates
+# the tags it receives on and tells the other side in the handshake.
+# Endpoint ids are never reused within a process, thus no two endpoints
+# of a worker receive on the same tag.
+TAG_STREAM_BITS = 16
+TAG_STREAM_MASK = (1 << TAG_STREAM_BITS) - 1
+TAG_CTRL_STREAM = 0
+TAG_MSG_STREAM = 1
+_endpoint_ids = itertools.count(1)
+
+
+def _allocate_tag():
+    """Returns the tag of a new endpoint, with all stream bits cleared"""
+    endpoint_id = next(_endpoint_ids)
+    if endpoint_id >> (64 - TAG_STREAM_BITS):
+        raise UCXError("Out of endpoint ids")
+    return endpoint_id << TAG_STREAM_BITS
+
+
+# The handshake the client sends over the stream API when connecting,
+# the server answers with its own. The first two fields must stay put
+# for mismatched peers to be detected.
+cdef struct Handshake:
+    uint64_t magic
+    uint32_t version
+    uint32_t progress_mode
+    uint64_t cuda_support
+    uint64_t max_eager_size
+    uint64_t peer_id
+    # The tag the sender receives on, see `_allocate_tag()`
+    uint64_t tag
+
+
+cdef _fill_handshake(Handshake *handshake, dict info, uint64_t tag):
+    memset(handshake, 0, sizeof(Handshake))
+    handshake.magic = _HANDSHAKE_MAGIC
+    handshake.version = info["version"]
+    handshake.progress_mode = _PROGRESS_MODES.index(info["progress_mode"])
+    handshake.cuda_support = info["cuda_support"]
+    handshake.max_eager_size = info["max_eager_size"]
+    handshake.peer_id = info["peer_id"]
+    handshake.tag = tag
+
+
+cdef _fill_rejection(Handshake *handshake):
+    """The handshake answering one we can't accept, the zeroed magic
+    tells the peer we won't talk to it"""
+    memset(handshake, 0, sizeof(Handshake))
+    handshake.version = PROTOCOL_VERSION
+
+
+cdef dict _read_handshake(Handshake *handshake):
+    """Returns what the peer told about itself in `handshake`, raises
+    UCXError if the peer doesn't speak our protocol"""
+    if handshake.magic == 0:
+        # See `_fill_rejection()`
+        raise UCXError(
+            "Handshake failed: the peer, speaking protocol version %d, "
+            "rejected ours" % handshake.version
+        )
+    if handshake.magic != _HANDSHAKE_MAGIC:
+        raise UCXError("Handshake failed: the peer predates protocol "
+                       "version %d" % PROTOCOL_VERSION)
+    if handshake.version != PROTOCOL_VERSION:
+        raise UCXError(
+            "Handshake failed: the peer speaks protocol version %d, not %d" %
+            (handshake.version, PROTOCOL_VERSION)
+        )
+    mode = handshake.progress_mode
+    if mode >= len(_PROGRESS_MODES):
+        mode = None
+    return {
+        "version": handshake.version,
+        "cuda_support": bool(handshake.cuda_support),
+        "max_eager_size": handshake.max_eager_size,
+        "progress_mode": None if mode is None else _PROGRESS_MODES[mode],
+        "peer_id": handshake.peer_id,
+    }
+
+
+def _parse_memunits(str value):
+    """Returns the bytes of a UCX memory units value such as "8K",
+    None if it isn't a size such as "auto" """
+    value = value.strip().lower()
+    if value == "inf":
+        return 2 ** 64 - 1
+    m = re.match(r"^(\d+)([kmgt]?)b?$", value)
+    if m is None:
+        return None
+    return int(m.group(1)) * 1024 ** " kmgt".index(m.group(2) or " ")
+
+
+def _max_eager_size(config):
+    """Returns the size above which UCX sends messages by rendezvous,
+    zero if UCX picks it at runtime"""
+    ret = 2 ** 64 - 1
+    # E.g. "intra:8K,inter:auto", the smaller of the sizes applies
+    for value in config.get("RNDV_THRESH", "auto").split(","):
+        size = _parse_memunits(value.split(":")[-1])
+        if size is None:
+            return 0
+        ret = min(ret, size)
+    return ret
 
 
-# The tags used when send/recv messages
-cdef struct Tags:
-    uint64_t msg_tag
-    uint64_t ctrl_tag
+def _post_shutdown_recv(ep):
+    """Posts the receive of the shutdown message of the peer of `ep`,
+    returns its operation"""
+    # Kept by the endpoint for as long as the receive can complete
+    ep._shutdown_msg = array.array("Q", [0])
+    log = "[Recv shutdown] ep: %s, tag: %s" % (
+        hex(ep.uid), hex(ep._ctrl_recv_tag)
+    )
+    return tag_recv(
+        ep._ucp_worker,
+        ep._shutdown_msg,
+        ep._shutdown_msg.itemsize,
+        ep._ctrl_recv_tag,
+        registry=ep._inflight, log=log
+    )
 
 
 def asyncio_handle_exception(loop, context):
@@ -105,7 +411,8 @@ def asyncio_handle_exception(loop, context):
     log("Ignored except: %s %s" % (type(msg), msg))
 
 
-async def listener_handler(ucp_endpoint, ucp_worker, config, func):
+async def listener_handler(ucp_endpoint, ucp_worker, config, handshake_info,
+                           func):
     from ..public_api import Endpoint
     loop = asyncio.get_event_loop()
     # TODO: exceptions in this callback is never showed when no
@@ -115,30 +422,41 @@ async def listener_handler(ucp_endpoint, ucp_worker, config, func):
     if loop.get_exception_handler() is None:
         loop.set_exception_handler(asyncio_handle_exception)
 
-    # Get the tags from the client and create a new _Endpoint
-    cdef Tags tags
-    cdef Tags[::1] tags_mv = <Tags[:1:1]>(&tags)
-    await stream_recv(ucp_endpoint, tags_mv, tags_mv.nbytes)
-    ep = _Endpoint(ucp_endpoint, ucp_worker, config, tags.msg_tag, tags.ctrl_tag)
-
-    logging.debug("listener_handler() server: %s, msg-tag: %s, ctrl-tag: %s" %(
-        hex(<size_t>ucp_endpoint), hex(ep._msg_tag), hex(ep._ctrl_tag))
+    # Get the handshake of the client and answer with ours
+    cdef Handshake peer_handshake
+    cdef Handshake[::1] peer_handshake_mv = <Handshake[:1:1]>(&peer_handshake)
+    cdef Handshake handshake
+    cdef Handshake[::1] handshake_mv = <Handshake[:1:1]>(&handshake)
+    try:
+        await stream_recv(ucp_endpoint, peer_handshake_mv,
+                          peer_handshake_mv.nbytes)
+        peer_info = _read_handshake(&peer_handshake)
+    except UCXError as e:
+        # Answer anyway, for the client to fail rather than wait for us
+        logging.error("listener_handler() server: %s, %s" % (
+            hex(<size_t>ucp_endpoint), e)
+        )
+        ep = _Endpoint(ucp_endpoint, ucp_worker, config, 0, 0)
+        _fill_rejection(&handshake)
+        await stream_send(ucp_endpoint, handshake_mv, handshake_mv.nbytes)
+        ep.close()
+        return
+    ep = _Endpoint(ucp_endpoint, ucp_worker, config, _allocate_tag(),
+                   peer_handshake.tag, peer_info=peer_info)
+    _fill_handshake(&handshake, handshake_info, ep._tag)
+
+    logging.debug("listener_handler() server: %s, tag: %s, peer-tag: %s" %(
+        hex(<size_t>ucp_endpoint), hex(ep._tag), hex(ep._peer_tag))
     )
 
     # Initiate the shutdown receive
-    cdef uint64_t shutdown_msg
-    cdef uint64_t[::1] shutdown_msg_mv = <uint64_t[:1:1]>(&shutdown_msg)
-    log = "[Recv shutdown] ep: %s, tag: %s" % (hex(ep.uid), hex(ep._ctrl_tag))
-    ep.pending_msg_list.append({'log': log})
-    shutdown_fut = tag_recv(ucp_worker,
-                            shutdown_msg_mv,
-                            shutdown_msg_mv.nbytes,
-                            ep._ctrl_tag,
-                            pending_msg=ep.pending_msg_list[-1])
+    shutdown_fut = _post_shutdown_recv(ep)
+    await stream_send(ucp_endpoint, handshake_mv, handshake_mv.nbytes)
     ep = Endpoint(ep)
+    _endpoints[ucp_endpoint] = ep
 
     def _close(future):
-        logging.debug(log)
+        logging.debug(future.log)
         if not ep.closed():
             ep.close()
     shutdown_fut.add_done_callback(_close)
@@ -154,21 +472,55 @@ async def listener_handler(ucp_endpoint, ucp_worker, config, func):
     await func_fut
 
 
-cdef void _listener_callback(ucp_ep_h ep, void *args):
-    cdef _listener_callback_args *a = <_listener_callback_args *> args
-    cdef object config = <object> a.py_config
-    cdef object func = <object> a.py_func
-    asyncio.ensure_future(
+# The listeners by id, the UCX callback is given the id since the
+# listener might be destroyed before the connection is handled
+_listeners = {}
+_listener_ids = itertools.count(1)
+
+
+cdef _handle_listener_event(ucp_ep_h ep, size_t listener_id):
+    cdef _Listener listener = _listeners.get(listener_id)
+    cdef ucs_status_ptr_t status
+    if listener is None:
+        logging.debug("Dropped connection of destroyed listener")
+        status = ucp_ep_close_nb(ep, UCP_EP_CLOSE_MODE_FORCE)
+        if not UCS_PTR_IS_ERR(status) and UCS_PTR_STATUS(status) != UCS_OK:
+            ucp_request_free(status)
+        return
+    call_deferrable(
+        asyncio.ensure_future,
         listener_handler(
             PyLong_FromVoidPtr(<void*>ep),
-            PyLong_FromVoidPtr(<void*>a.ucp_worker),
-            config,
-            func
+            listener.ucp_worker,
+            listener.config,
+            listener.handshake_info,
+            listener.func
         )
     )
 
 
-cdef void ucp_request_init(void* request):
+cdef void _listener_callback(ucp_ep_h ep, void *args) nogil:
+    if c_util_completion_ring_push(&ucxpy_events, <void*> ep, UCS_OK,
+                                   <size_t> args, _LISTENER_EVENT):
+        # Out of memory, handle the connection right away
+        _handle_listener_event_with_gil(ep, <size_t> args)
+
+
+cdef void _handle_listener_event_with_gil(ucp_ep_h ep,
+                                          size_t listener_id) with gil:
+    _handle_listener_event(ep, listener_id)
+
+
+cdef _process_events():
+    cdef c_util_completion_t event
+    while c_util_completion_ring_pop(&ucxpy_events, &event):
+        if event.kind == _LISTENER_EVENT:
+            _handle_listener_event(<ucp_ep_h> event.request, event.length)
+        else:
+            _handle_am_event(<_AmEvent*> event.request)
+
+
+cdef void ucp_request_init(void* request) nogil:
     cdef ucp_request *req = <ucp_request*> request
     req.finished = False
     req.future = NULL
@@ -182,34 +534,388 @@ cdef class _Listener:
     """
     cdef:
         cdef ucp_listener_h _ucp_listener
-        cdef _listener_callback_args _cb_args
         cdef uint16_t _port
+        cdef size_t id
+        # What the accepted endpoints are created with
+        object ucp_worker
+        object config
+        object handshake_info
+        object func
 
     def port(self):
         return self._port
 
     def destroy(self):
         ucp_listener_destroy(self._ucp_listener)
+        _listeners.pop(self.id, None)
 
 
-cdef class ApplicationContext:
+cdef class _Worker:
+    """A UCP worker of an application context and the progress of it
+
+    The worker is bound to one event loop, which is the only one its
+    operations complete on. The loop progresses the worker whenever its
+    epoll fd signals or, in the "thread" progress mode, receives the
+    completions from a thread of the worker's own. The worker doesn't own
+    the context, which must destroy the worker before it is cleaned up
+    itself.
+    """
     cdef:
-        ucp_context_h context
-        # For now, a application context only has one worker
         ucp_worker_h worker
+        bint initiated
         int epoll_fd
-        object all_epoll_binded_to_event_loop
+        readonly str progress_mode
+        readonly double spin_time
+        readonly unsigned progress_budget
+        # The event loop the worker is bound to
+        readonly object loop
+        # The task of `loop` that arms the worker
+        object arm_task
+        # Whether the last progress ran out of budget, thus the worker
+        # most likely has more work to do
+        bint progress_pending
+        readonly unsigned long long progress_count
+        readonly unsigned long long progress_calls
+        readonly unsigned long long budget_exhausted_count
+        # The thread progressing the worker in the "thread" progress mode,
+        # which hands the work of UCX callbacks to `loop`
+        object progress_thread
+        bint progress_thread_running
+        # The active message handlers by id and the addresses of what UCX
+        # hands to `_am_callback()` for them
+        dict am_handlers
+        dict am_args
+
+    def __cinit__(self, ApplicationContext ctx):
+        cdef ucp_worker_params_t worker_params
+        cdef ucs_status_t status
+        self.initiated = False
+        self.epoll_fd = -1
+        self.loop = None
+        self.arm_task = None
+        self.progress_mode = ctx.progress_mode
+        self.spin_time = ctx.spin_time
+        self.progress_budget = ctx.progress_budget
+        self.progress_pending = False
+        self.progress_count = 0
+        self.progress_calls = 0
+        self.budget_exhausted_count = 0
+        self.progress_thread = None
+        self.am_handlers = {}
+        self.am_args = {}
+
+        worker_params.field_mask = UCP_WORKER_PARAM_FIELD_THREAD_MODE
+        worker_params.thread_mode = UCS_THREAD_MODE_MULTI
+        status = ucp_worker_create(ctx.context, &worker_params, &self.worker)
+        assert_ucs_status(status)
+        self.initiated = True
+
+        cdef int ucp_epoll_fd
+        status = ucp_worker_get_efd(self.worker, &ucp_epoll_fd)
+        assert_ucs_status(status)
+
+        self.epoll_fd = epoll_create(1)
+        cdef epoll_event ev
+        ev.data.fd = ucp_epoll_fd
+        ev.events = EPOLLIN
+        cdef int err = epoll_ctl(self.epoll_fd, EPOLL_CTL_ADD,
+                                 ucp_epoll_fd, &ev)
+        assert(err == 0)
+
+    def destroy(self):
+        """Stops the progress of the worker and destroys it"""
+        if not self.initiated:
+            return
+        self.stop_progress_thread()
+        process_completions()
+        _process_events()
+        check_close_waiters(self.handle)
+        cancel_close_waiters(self.handle)
+        self._unbind()
+        ucp_worker_destroy(self.worker)
+        self.initiated = False
+        for arg in self.am_args.values():
+            free(PyLong_AsVoidPtr(arg))
+        self.am_args.clear()
+        self.am_handlers.clear()
+        close(self.epoll_fd)
+        self.epoll_fd = -1
+
+    @property
+    def handle(self):
+        return PyLong_FromVoidPtr(<void*>self.worker)
+
+    cdef bint _progress(self) except *:
+        cdef bint ret = False
+        cdef unsigned ncalls = 0
+        if not self.initiated:
+            return False
+        self.progress_pending = False
+        while ucp_worker_progress(self.worker) != 0:
+            ret = True
+            ncalls += 1
+            if ncalls == self.progress_budget:
+                self.progress_pending = True
+                self.budget_exhausted_count += 1
+                break
+        self.progress_count += 1
+        self.progress_calls += ncalls
+        process_completions()
+        _process_events()
+        tag_probe_waiters(PyLong_FromVoidPtr(<void*>self.worker))
+        check_close_waiters(PyLong_FromVoidPtr(<void*>self.worker))
+        return ret
+
+    def progress(self):
+        return self._progress()
+
+    cdef bint _arm(self) except *:
+        """Arms the worker for waiting on its epoll fd. Returns False
+        if the worker has events that must be progressed first."""
+        cdef ucs_status_t status = ucp_worker_arm(self.worker)
+        if status == UCS_ERR_BUSY:
+            return False
+        assert_ucs_status(status)
+        return True
+
+    async def _arm_worker(self):
+        # Arming is only safe when UCX has nothing left to progress and
+        # when every task that isn't waiting on UCX has run, since those
+        # might post new operations. Then the next thing the event loop
+        # does is to wait on the epoll fd, which UCX will signal.
+        # In the "spin" progress mode, we keep polling until the worker
+        # hasn't made progress for `spin_time` seconds, which saves the
+        # wake-up latency when messages arrive in quick succession.
+        # A progress that ran out of budget is continued after the other
+        # tasks have run, without arming since the worker isn't idle.
+        cdef double deadline = 0
+        while self.initiated:
+            if self._progress() and self.spin_time > 0:
+                deadline = time.monotonic() + self.spin_time
+            await asyncio.sleep(0)
+            if self.progress_pending:
+                continue
+            if deadline > 0 and time.monotonic() < deadline:
+                continue
+            if self._arm():
+                break
+
+    def _fd_reader_callback(self):
+        self._progress()
+        if self.arm_task is None or self.arm_task.done():
+            self.arm_task = self.loop.create_task(self._arm_worker())
+
+    def _start_progress_thread(self):
+        self.progress_thread_running = True
+        self.progress_thread = threading.Thread(
+            target=self._progress_thread_main,
+            name="ucx-py-progress",
+            daemon=True
+        )
+        self.progress_thread.start()
+
+    def stop_progress_thread(self):
+        if self.progress_thread is None:
+            return
+        self.progress_thread_running = False
+        ucp_worker_signal(self.worker)
+        self.progress_thread.join()
+        self.progress_thread = None
+
+    def _progress_thread_main(self):
+        cdef ucp_worker_h worker = self.worker
+        cdef int epoll_fd = self.epoll_fd
+        cdef epoll_event ev
+        cdef ucs_status_t status
+        ucp_worker = PyLong_FromVoidPtr(<void*>worker)
+        start_deferring(ucp_worker)
+        while self.progress_thread_running:
+            # The UCX callbacks don't need the GIL, they only record
+            # their work, which is done afterwards with the GIL
+            with nogil:
+                while ucp_worker_progress(worker) != 0:
+                    pass
+            process_completions()
+            _process_events()
+
+            # The UCX callbacks only recorded their work, which is
+            # handed over to the event loop in one go
+            batch = take_deferred()
+            if (batch or has_probe_waiters(ucp_worker)
+                    or has_close_waiters(ucp_worker)):
+                try:
+                    self.loop.call_soon_threadsafe(
+                        self._run_deferred, batch
+                    )
+                except (RuntimeError, AttributeError):
+                    # The event loop has been closed, or the worker is
+                    # being bound to another one, which is where the
+                    # work was heading
+                    pass
+
+            with nogil:
+                status = ucp_worker_arm(worker)
+                if status == UCS_OK:
+                    epoll_wait(epoll_fd, &ev, 1, -1)
+            if status != UCS_OK and status != UCS_ERR_BUSY:
+                msg = (<object> ucs_status_string(status)).decode("utf-8")
+                logging.error("Progress thread stopped: [ucp_worker_arm] %s"
+                              % msg)
+                break
+        stop_deferring(ucp_worker)
+
+    def _run_deferred(self, batch):
+        if not self.initiated:
+            return
+        if batch:
+            run_deferred(batch)
+        tag_probe_waiters(PyLong_FromVoidPtr(<void*>self.worker))
+        check_close_waiters(PyLong_FromVoidPtr(<void*>self.worker))
+
+    def bind_to_event_loop(self, loop):
+        """Makes `loop` progress the worker, or receive the completions
+        of the progress thread in the "thread" progress mode, instead of
+        the loop the worker was bound to before"""
+        self._unbind()
+        self.loop = loop
+        if self.progress_mode == "thread":
+            if self.progress_thread is None:
+                self._start_progress_thread()
+            return
+        loop.add_reader(self.epoll_fd, self._fd_reader_callback)
+        self.arm_task = loop.create_task(self._arm_worker())
+
+    def _unbind(self):
+        if self.arm_task is not None:
+            self.arm_task.cancel()
+            self.arm_task = None
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.remove_reader(self.epoll_fd)
+        self.loop = None
+
+    def wait(self, op):
+        """Progresses the worker until `op` has completed and returns its
+        result. The GIL is released while progressing and waiting for
+        events. Only for workers that aren't bound to an event loop."""
+        cdef ucp_worker_h worker = self.worker
+        cdef int epoll_fd = self.epoll_fd
+        cdef epoll_event ev
+        cdef ucs_status_t status
+        cdef unsigned ncalls
+        while not op.done():
+            with nogil:
+                ncalls = ucp_worker_progress(worker)
+            process_completions()
+            _process_events()
+            check_close_waiters(PyLong_FromVoidPtr(<void*>worker))
+            if ncalls != 0 or op.done():
+                continue
+            with nogil:
+                status = ucp_worker_arm(worker)
+                if status == UCS_OK:
+                    epoll_wait(epoll_fd, &ev, 1, -1)
+            if status != UCS_ERR_BUSY:
+                assert_ucs_status(status, "ucp_worker_arm")
+        return op.result()
+
+    def set_am_handler(self, am_id, callback):
+        cdef ucs_status_t status
+        cdef _AmHandlerArg *arg
+        if callback is None:
+            status = ucp_worker_set_am_handler(self.worker, am_id, NULL,
+                                               NULL, UCP_AM_FLAG_WHOLE_MSG)
+            assert_ucs_status(status, "ucp_worker_set_am_handler")
+            self.am_handlers.pop(am_id, None)
+            old_arg = self.am_args.pop(am_id, None)
+            if old_arg is not None:
+                # UCX doesn't call the removed handler anymore
+                free(PyLong_AsVoidPtr(old_arg))
+            return
+        # Messages already received go to the new handler as well
+        self.am_handlers[am_id] = callback
+        if am_id in self.am_args:
+            return
+        arg = <_AmHandlerArg*> malloc(sizeof(_AmHandlerArg))
+        if arg == NULL:
+            raise MemoryError("Failed allocation of _AmHandlerArg")
+        arg.worker = <PyObject*> self
+        arg.am_id = am_id
+        status = ucp_worker_set_am_handler(self.worker, am_id, _am_callback,
+                                           arg, UCP_AM_FLAG_WHOLE_MSG)
+        if status != UCS_OK:
+            free(arg)
+            del self.am_handlers[am_id]
+            assert_ucs_status(status, "ucp_worker_set_am_handler")
+        self.am_args[am_id] = PyLong_FromVoidPtr(arg)
+
+
+cdef class _LoopWorkers:
+    """The workers of an event loop"""
+    cdef:
+        list workers
+        Py_ssize_t next
+
+    def __cinit__(self):
+        self.workers = []
+        self.next = 0
+
+
+cdef class ApplicationContext:
+    cdef:
+        ucp_context_h context
+        # All workers of the context
+        readonly list workers
+        # Maps an event loop to its `_LoopWorkers`
+        dict loop_workers
+        # The workers that aren't bound to an event loop
+        list free_workers
+        # The worker of each thread that uses the blocking API
+        object thread_workers
+        Py_ssize_t num_workers
+        object lock
         object config
+        dict am_handlers
         bint initiated
-
-    def __cinit__(self, config_dict={}):
+        readonly str progress_mode
+        # What this process tells its peers about itself when connecting
+        readonly dict handshake_info
+        # How long the event loop keeps polling a worker after it last
+        # made progress before it waits on the epoll fd
+        readonly double spin_time
+        # The maximum number of worker progress calls per progress of
+        # the event loop, zero means no limit
+        readonly unsigned progress_budget
+
+    def __cinit__(self, config_dict={}, progress_mode=None, spin_time=None,
+                  progress_budget=None, num_workers=None):
         cdef ucp_params_t ucp_params
-        cdef ucp_worker_params_t worker_params
         cdef ucs_status_t status
-        self.all_epoll_binded_to_event_loop = set()
+        self.workers = []
+        self.loop_workers = {}
+        self.free_workers = []
+        self.thread_workers = threading.local()
+        self.lock = threading.Lock()
         self.config = {}
+        self.am_handlers = {}
         self.initiated = False
 
+        if progress_mode is None:
+            progress_mode = os.environ.get("UCXPY_PROGRESS_MODE", "blocking")
+        if progress_mode not in ("blocking", "spin", "thread"):
+            raise ValueError("Unknown progress mode: %s" % progress_mode)
+        self.progress_mode = progress_mode
+        self.spin_time = 0
+        if progress_mode == "spin":
+            self.spin_time = 1e-3 if spin_time is None else spin_time
+        if progress_budget is None:
+            progress_budget = os.environ.get("UCXPY_PROGRESS_BUDGET", 0)
+        self.progress_budget = int(progress_budget)
+        if num_workers is None:
+            num_workers = os.environ.get("UCXPY_NUM_WORKERS", 1)
+        self.num_workers = int(num_workers)
+        if self.num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+
         cdef unsigned int a, b, c
         ucp_get_version(&a, &b, &c)
         self.config['VERSION'] = (a, b, c)
@@ -221,7 +927,10 @@ cdef class ApplicationContext:
 
         ucp_params.features = (UCP_FEATURE_TAG |  # noqa
                                UCP_FEATURE_WAKEUP |  # noqa
-                               UCP_FEATURE_STREAM)
+                               UCP_FEATURE_STREAM |  # noqa
+                               UCP_FEATURE_RMA |  # noqa
+                               UCP_FEATURE_AMO64 |  # noqa
+                               UCP_FEATURE_AM)
 
         ucp_params.request_size = sizeof(ucp_request)
         ucp_params.request_init = ucp_request_init
@@ -229,41 +938,89 @@ cdef class ApplicationContext:
         cdef ucp_config_t *config = read_ucx_config(config_dict)
         status = ucp_init(&ucp_params, config, &self.context)
         assert_ucs_status(status)
+        self.initiated = True
 
-        worker_params.field_mask = UCP_WORKER_PARAM_FIELD_THREAD_MODE
-        worker_params.thread_mode = UCS_THREAD_MODE_MULTI
-        status = ucp_worker_create(self.context, &worker_params, &self.worker)
-        assert_ucs_status(status)
-
-        cdef int ucp_epoll_fd
-        status = ucp_worker_get_efd(self.worker, &ucp_epoll_fd)
-        assert_ucs_status(status)
-
-        self.epoll_fd = epoll_create(1)
-        cdef epoll_event ev
-        ev.data.fd = ucp_epoll_fd
-        ev.events = EPOLLIN
-        cdef int err = epoll_ctl(self.epoll_fd, EPOLL_CTL_ADD,
-                                 ucp_epoll_fd, &ev)
-        assert(err == 0)
+        # The workers of the first event loop are created upfront
+        for _ in range(self.num_workers):
+            self.free_workers.append(self._create_worker())
 
         self.config = get_ucx_config_options(config)
         ucp_config_release(config)
+        self.handshake_info = {
+            "version": PROTOCOL_VERSION,
+            "cuda_support": "cuda" in self.config['TLS'],
+            "max_eager_size": _max_eager_size(self.config),
+            "progress_mode": self.progress_mode,
+            "peer_id": uuid.uuid4().int & 0xFFFFFFFFFFFFFFFF,
+        }
 
         logging.info("UCP initiated using config: ")
         for k, v in self.config.items():
             logging.info("  %s: %s" % (k, v))
 
-        self.initiated = True
-
     def __dealloc__(self):
         if self.initiated:
-            ucp_worker_destroy(self.worker)
+            for worker in self.workers:
+                worker.destroy()
             ucp_cleanup(self.context)
 
+    cdef _Worker _create_worker(self):
+        cdef _Worker ret = _Worker(self)
+        for am_id, callback in self.am_handlers.items():
+            ret.set_am_handler(am_id, callback)
+        self.workers.append(ret)
+        return ret
+
+    cdef _LoopWorkers _loop_workers(self):
+        """Returns the workers of the current event loop
+
+        Each event loop gets workers of its own, thus the operations of
+        different loops never complete on each other's loop or compete
+        for the same worker. The workers of closed loops are reused.
+        """
+        loop = asyncio.get_event_loop()
+        cdef _LoopWorkers ret = self.loop_workers.get(loop)
+        if ret is not None:
+            return ret
+        with self.lock:
+            for other in list(self.loop_workers):
+                if other.is_closed():
+                    self.free_workers.extend(
+                        (<_LoopWorkers> self.loop_workers.pop(other)).workers
+                    )
+            ret = _LoopWorkers()
+            while len(ret.workers) < self.num_workers:
+                if self.free_workers:
+                    worker = self.free_workers.pop()
+                else:
+                    worker = self._create_worker()
+                worker.bind_to_event_loop(loop)
+                ret.workers.append(worker)
+            self.loop_workers[loop] = ret
+        return ret
+
+    cdef _Worker _thread_worker(self):
+        """Returns the worker of the current thread for the blocking API,
+        which is never bound to an event loop thus only progressed by the
+        thread itself"""
+        cdef _Worker ret = getattr(self.thread_workers, "worker", None)
+        if ret is None:
+            with self.lock:
+                ret = self._create_worker()
+            self.thread_workers.worker = ret
+        return ret
+
+    cdef _Worker _next_worker(self):
+        """Returns the worker of the current event loop to assign the
+        next endpoint or listener to, round-robin"""
+        cdef _LoopWorkers loop_workers = self._loop_workers()
+        cdef _Worker ret = loop_workers.workers[loop_workers.next]
+        loop_workers.next = (loop_workers.next + 1) % len(loop_workers.workers)
+        return ret
+
     def create_listener(self, callback_func, port=None):
         from ..public_api import Listener
-        self._bind_epoll_fd_to_event_loop()
+        cdef _Worker worker = self._next_worker()
         if port in (None, 0):
             # Ref https://unix.stackexchange.com/a/132524
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -271,97 +1028,423 @@ cdef class ApplicationContext:
             port = s.getsockname()[1]
             s.close()
 
-        ret = _Listener()
+        cdef _Listener ret = _Listener()
         ret._port = port
+        ret.id = next(_listener_ids)
 
-        ret._cb_args.ucp_worker = self.worker
-        ret._cb_args.py_func = <PyObject*> callback_func
-        ret._cb_args.py_config = <PyObject*> self.config
-        Py_INCREF(self.config)
-        Py_INCREF(callback_func)
+        # The endpoints accepted by the listener share its worker
+        ret.ucp_worker = worker.handle
+        ret.func = callback_func
+        ret.config = self.config
+        ret.handshake_info = self.handshake_info
 
         cdef ucp_listener_params_t params
         if c_util_get_ucp_listener_params(&params,
                                           port,
                                           _listener_callback,
-                                          <void*> &ret._cb_args):
+                                          <void*> ret.id):
             raise MemoryError("Failed allocation of ucp_ep_params_t")
 
         logging.info("create_listener() - Start listening on port %d" % port)
         cdef ucs_status_t status = ucp_listener_create(
-            self.worker, &params, &ret._ucp_listener
+            worker.worker, &params, &ret._ucp_listener
         )
         c_util_get_ucp_listener_params_free(&params)
         assert_ucs_status(status)
+        _listeners[ret.id] = ret
         return Listener(ret)
 
     async def create_endpoint(self, str ip_address, port):
         from ..public_api import Endpoint
-        self._bind_epoll_fd_to_event_loop()
+        cdef _Worker worker = self._next_worker()
 
         cdef ucp_ep_params_t params
         if c_util_get_ucp_ep_params(&params, ip_address.encode(), port):
             raise MemoryError("Failed allocation of ucp_ep_params_t")
 
         cdef ucp_ep_h ucp_ep
-        cdef ucs_status_t status = ucp_ep_create(self.worker, &params, &ucp_ep)
+        cdef ucs_status_t status = ucp_ep_create(worker.worker, &params,
+                                                 &ucp_ep)
         c_util_get_ucp_ep_params_free(&params)
         assert_ucs_status(status)
 
-        # Create a new Endpoint and send the tags to the peer
-        cdef Tags tags = {"msg_tag": hash(uuid.uuid4()),
-                          "ctrl_tag": hash(uuid.uuid4())}
-        cdef Tags[::1] tags_mv = <Tags[:1:1]>(&tags)
-
+        # Create a new Endpoint and exchange handshakes with the peer,
+        # which tell each side the tag the other receives on
+        cdef Handshake handshake
+        cdef Handshake[::1] handshake_mv = <Handshake[:1:1]>(&handshake)
+        cdef Handshake peer_handshake
+        cdef Handshake[::1] peer_handshake_mv = <Handshake[:1:1]>(&peer_handshake)
         ep = _Endpoint(
             PyLong_FromVoidPtr(<void*> ucp_ep),
-            PyLong_FromVoidPtr(<void*> self.worker),
+            worker.handle,
             self.config,
-            tags.msg_tag,
-            tags.ctrl_tag,
+            _allocate_tag(),
+            0,
         )
-        await stream_send(ep._ucp_endpoint, tags_mv, tags_mv.nbytes)
+        _fill_handshake(&handshake, self.handshake_info, ep._tag)
+        peer_handshake_op = stream_recv(ep._ucp_endpoint, peer_handshake_mv,
+                                        peer_handshake_mv.nbytes,
+                                        registry=ep._inflight)
+        try:
+            await stream_send(ep._ucp_endpoint, handshake_mv,
+                              handshake_mv.nbytes, registry=ep._inflight)
+            await peer_handshake_op
+            ep._peer_info = _read_handshake(&peer_handshake)
+            ep._set_tags(ep._tag, peer_handshake.tag)
+        except BaseException:
+            ep.close()
+            raise
 
         # Initiate the shutdown receive
-        cdef uint64_t shutdown_msg
-        cdef uint64_t[::1] shutdown_msg_mv = <uint64_t[:1:1]>(&shutdown_msg)
-        log = "[Recv shutdown] ep: %s, tag: %s" % (hex(ep.uid), hex(ep._ctrl_tag))
-        ep.pending_msg_list.append({'log': log})
-        shutdown_fut = tag_recv(
-            PyLong_FromVoidPtr(<void*>self.worker),
-            shutdown_msg_mv,
-            shutdown_msg_mv.nbytes,
-            ep._ctrl_tag,
-            pending_msg=ep.pending_msg_list[-1]
-        )
+        shutdown_fut = _post_shutdown_recv(ep)
         ep = Endpoint(ep)
+        _endpoints[ep.uid] = ep
 
         def _close(future):
-            logging.debug(log)
+            logging.debug(future.log)
             if not ep.closed():
                 ep.close()
         shutdown_fut.add_done_callback(_close)
         return ep
 
-    cdef _progress(self):
-        while ucp_worker_progress(self.worker) != 0:
-            pass
+    async def create_endpoints(self, addresses, concurrency=None,
+                               return_exceptions=False):
+        addresses = [(str(ip_address), port) for ip_address, port in addresses]
+        if concurrency is not None and concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        semaphore = asyncio.Semaphore(concurrency or len(addresses) or 1)
+
+        async def _create_endpoint(ip_address, port):
+            async with semaphore:
+                return await self.create_endpoint(ip_address, port)
+
+        # Every task creates its UCX endpoint and posts the handshake
+        # before the first one waits, thus the handshakes are in
+        # flight together rather than one round trip after the other
+        ret = await asyncio.gather(
+            *[_create_endpoint(ip, port) for ip, port in addresses],
+            return_exceptions=True
+        )
+        failures = [
+            (address, e) for address, e in zip(addresses, ret)
+            if isinstance(e, BaseException)
+        ]
+        if failures and not return_exceptions:
+            for ep in ret:
+                if not isinstance(ep, BaseException) and not ep.closed():
+                    ep.close()
+            msg = "create_endpoints() - failed to connect to %d of %d " \
+                  "peers: %s" % (
+                      len(failures), len(addresses),
+                      ", ".join("%s:%s (%s)" % (ip, port, e)
+                                for (ip, port), e in failures)
+                  )
+            raise UCXError(msg) from failures[0][1]
+        return ret
+
+    def connect(self, str ip_address, port):
+        from ..public_api import Endpoint
+        cdef _Worker worker = self._thread_worker()
 
-    def progress(self):
-        self._progress()
+        cdef ucp_ep_params_t params
+        if c_util_get_ucp_ep_params(&params, ip_address.encode(), port):
+            raise MemoryError("Failed allocation of ucp_ep_params_t")
 
-    def _bind_epoll_fd_to_event_loop(self):
-        loop = asyncio.get_event_loop()
-        if loop not in self.all_epoll_binded_to_event_loop:
-            loop.add_reader(self.epoll_fd, self.progress)
-            self.all_epoll_binded_to_event_loop.add(loop)
+        cdef ucp_ep_h ucp_ep
+        cdef ucs_status_t status = ucp_ep_create(worker.worker, &params,
+                                                 &ucp_ep)
+        c_util_get_ucp_ep_params_free(&params)
+        assert_ucs_status(status)
+
+        # Create a new Endpoint and exchange handshakes with the peer,
+        # which tell each side the tag the other receives on
+        cdef Handshake handshake
+        cdef Handshake[::1] handshake_mv = <Handshake[:1:1]>(&handshake)
+        cdef Handshake peer_handshake
+        cdef Handshake[::1] peer_handshake_mv = <Handshake[:1:1]>(&peer_handshake)
+        ep = _Endpoint(
+            PyLong_FromVoidPtr(<void*> ucp_ep),
+            worker.handle,
+            self.config,
+            _allocate_tag(),
+            0,
+            blocking_worker=worker,
+        )
+        _fill_handshake(&handshake, self.handshake_info, ep._tag)
+        peer_handshake_op = stream_recv(ep._ucp_endpoint, peer_handshake_mv,
+                                        peer_handshake_mv.nbytes,
+                                        registry=ep._inflight)
+        try:
+            worker.wait(stream_send(ep._ucp_endpoint, handshake_mv,
+                                    handshake_mv.nbytes,
+                                    registry=ep._inflight))
+            worker.wait(peer_handshake_op)
+            ep._peer_info = _read_handshake(&peer_handshake)
+            ep._set_tags(ep._tag, peer_handshake.tag)
+        except BaseException:
+            ep.close()
+            raise
+
+        # Initiate the shutdown receive, nothing waits for it since
+        # there is no event loop to close the endpoint on
+        _post_shutdown_recv(ep)
+        ep = Endpoint(ep)
+        _endpoints[ep.uid] = ep
+        return ep
+
+    def progress(self):
+        """Progresses the workers of the current event loop, returns
+        whether any made progress"""
+        cdef _Worker worker
+        cdef bint ret = False
+        for worker in self._loop_workers().workers:
+            if worker._progress():
+                ret = True
+        return ret
+
+    def get_progress_stats(self):
+        cdef _Worker worker
+        ret = {
+            "progress_count": 0,
+            "progress_calls": 0,
+            "budget_exhausted_count": 0,
+        }
+        for worker in self.workers:
+            ret["progress_count"] += worker.progress_count
+            ret["progress_calls"] += worker.progress_calls
+            ret["budget_exhausted_count"] += worker.budget_exhausted_count
+        return ret
+
+    def stop_progress_threads(self):
+        for worker in self.workers:
+            worker.stop_progress_thread()
 
     def get_ucp_worker(self):
-        return PyLong_FromVoidPtr(<void*>self.worker)
+        """Returns the first worker of the current event loop, which is
+        its only one by default"""
+        return self._loop_workers().workers[0].handle
 
     def get_config(self):
         return self.config
 
+    def register_am_handler(self, am_id, callback):
+        for worker in self.workers:
+            worker.set_am_handler(am_id, callback)
+        if callback is None:
+            self.am_handlers.pop(am_id, None)
+        else:
+            # Also set on the workers created later
+            self.am_handlers[am_id] = callback
+
+    def create_memory_pool(self, slab_size, min_block_size):
+        return _MemoryPool(self, slab_size, min_block_size)
+
+    def register_memory(self, buffer):
+        return _MemoryRegion(self, buffer=buffer)
+
+
+cdef class _MemoryRegion:
+    """Host memory registered with UCX
+
+    Either allocates `length` bytes of page-aligned memory or registers
+    the memory of `buffer`, which is kept alive and must be writable since
+    the region is open to remote writes. The memory is unregistered
+    (and freed if allocated) when the region is deleted.
+    """
+    cdef:
+        ApplicationContext ctx
+        readonly object buffer
+        void *_address
+        readonly size_t length
+        ucp_mem_h memh
+
+    def __cinit__(self, ApplicationContext ctx, length=None, buffer=None):
+        self.ctx = ctx
+        self.memh = NULL
+        self._address = NULL
+        if buffer is None:
+            self.length = length
+            if posix_memalign(&self._address, 4096, max(self.length, 1)) != 0:
+                self._address = NULL
+                raise MemoryError("Failed allocation of %d bytes" % length)
+        else:
+            self.buffer = buffer
+            arr = get_buffer_array(
+                buffer, cuda_support="cuda" in ctx.config['TLS']
+            )
+            if not arr.contiguous:
+                raise ValueError("Array must be contiguous")
+            if not arr.writable:
+                # Peers with the remote key could write to it
+                raise ValueError("Cannot register a read-only buffer")
+            self.length = arr.nbytes
+            self._address = PyLong_AsVoidPtr(arr.ptr)
+
+        cdef ucp_mem_map_params_t params
+        params.field_mask = (UCP_MEM_MAP_PARAM_FIELD_ADDRESS |  # noqa
+                             UCP_MEM_MAP_PARAM_FIELD_LENGTH |  # noqa
+                             UCP_MEM_MAP_PARAM_FIELD_FLAGS)
+        params.address = self._address
+        params.length = max(self.length, 1)
+        params.flags = 0
+        cdef ucs_status_t status = ucp_mem_map(ctx.context, &params, &self.memh)
+        assert_ucs_status(status, "ucp_mem_map")
+
+    def __dealloc__(self):
+        if self.memh != NULL:
+            ucp_mem_unmap(self.ctx.context, self.memh)
+        if self.buffer is None:
+            free(self._address)
+
+    @property
+    def address(self):
+        return PyLong_FromVoidPtr(self._address)
+
+    def pack_rkey(self):
+        cdef void *rkey_buffer
+        cdef size_t size
+        cdef ucs_status_t status = ucp_rkey_pack(
+            self.ctx.context, self.memh, &rkey_buffer, &size
+        )
+        assert_ucs_status(status, "ucp_rkey_pack")
+        cdef bytes ret = (<char*> rkey_buffer)[:size]
+        ucp_rkey_buffer_release(rkey_buffer)
+        return ret
+
+
+cdef class PoolBuffer:
+    """A buffer handed out by a memory pool
+
+    Exposes both the buffer protocol and `__array_interface__` and gives
+    its block back to the pool when deleted.
+    """
+    cdef:
+        _MemoryPool pool
+        _MemoryRegion slab
+        void *address
+        readonly Py_ssize_t nbytes
+        int size_class
+        Py_ssize_t shape[1]
+        Py_ssize_t strides[1]
+
+    def __dealloc__(self):
+        if self.pool is not None and self.size_class >= 0:
+            self.pool.free_blocks[self.size_class].append(
+                (self.slab, PyLong_FromVoidPtr(self.address))
+            )
+
+    def __len__(self):
+        return self.nbytes
+
+    @property
+    def __array_interface__(self):
+        return {
+            "data": (PyLong_FromVoidPtr(self.address), False),
+            "shape": (self.nbytes,),
+            "typestr": "|u1",
+            "strides": None,
+            "version": 3,
+        }
+
+    def __getbuffer__(self, Py_buffer *buffer, int flags):
+        self.shape[0] = self.nbytes
+        self.strides[0] = 1
+        buffer.buf = self.address
+        buffer.obj = self
+        buffer.len = self.nbytes
+        buffer.readonly = 0
+        buffer.itemsize = 1
+        buffer.format = "B"
+        buffer.ndim = 1
+        buffer.shape = self.shape
+        buffer.strides = self.strides
+        buffer.suboffsets = NULL
+        buffer.internal = NULL
+
+    def __releasebuffer__(self, Py_buffer *buffer):
+        pass
+
+
+# The smallest size class of a memory pool, smaller blocks would cost
+# more in bookkeeping than they hold
+MIN_POOL_BLOCK_SIZE = 64
+
+
+cdef class _MemoryPool:
+    """This represents the private part of MemoryPool
+
+    See <..public_api.MemoryPool> for documentation
+    """
+    cdef:
+        ApplicationContext ctx
+        readonly size_t slab_size
+        readonly size_t min_block_size
+        # The size classes are the powers of two from `min_block_size`
+        # to `slab_size`. Each class has a list of free (slab, address)
+        list free_blocks
+        # The slab that blocks are carved off when a size class has no
+        # free block, and the offset of its first uncarved byte
+        _MemoryRegion slab
+        size_t slab_offset
+        readonly size_t nslabs
+
+    def __cinit__(self, ApplicationContext ctx, slab_size, min_block_size):
+        if min_block_size < MIN_POOL_BLOCK_SIZE or min_block_size > slab_size:
+            raise ValueError(
+                "min_block_size must be in [%d, slab_size]" % MIN_POOL_BLOCK_SIZE
+            )
+        self.ctx = ctx
+        self.slab_size = slab_size
+        self.min_block_size = min_block_size
+        self.slab = None
+        self.slab_offset = 0
+        self.nslabs = 0
+        self.free_blocks = []
+        cdef size_t block_size = min_block_size
+        while block_size <= slab_size:
+            self.free_blocks.append([])
+            block_size *= 2
+
+    cdef int _size_class(self, size_t nbytes):
+        cdef int ret = 0
+        cdef size_t block_size = self.min_block_size
+        while block_size < nbytes:
+            block_size *= 2
+            ret += 1
+        return ret if ret < len(self.free_blocks) else -1
+
+    def allocate(self, nbytes):
+        cdef PoolBuffer ret = PoolBuffer.__new__(PoolBuffer)
+        cdef int size_class = self._size_class(nbytes)
+        cdef size_t block_size
+        cdef _MemoryRegion slab
+        ret.nbytes = nbytes
+        ret.size_class = size_class
+        if size_class < 0:
+            # Too large for the pool, give it its own registered region
+            ret.slab = _MemoryRegion(self.ctx, length=nbytes)
+            ret.address = ret.slab._address
+            return ret
+
+        free_blocks = self.free_blocks[size_class]
+        if len(free_blocks) > 0:
+            slab, address = free_blocks.pop()
+            ret.address = PyLong_AsVoidPtr(address)
+        else:
+            # Carve one block off the current slab, which all size classes
+            # share. The rest of a slab too small for the block is unused.
+            block_size = self.min_block_size << size_class
+            if self.slab is None or self.slab_offset + block_size > self.slab_size:
+                self.slab = _MemoryRegion(self.ctx, length=self.slab_size)
+                self.slab_offset = 0
+                self.nslabs += 1
+            slab = self.slab
+            ret.address = <char*>slab._address + self.slab_offset
+            self.slab_offset += block_size
+        ret.pool = self
+        ret.slab = slab
+        return ret
+
 
 class _Endpoint:
     """This represents the private part of Endpoint
@@ -369,16 +1452,28 @@ class _Endpoint:
     See <..public_api.Endpoint> for documentation
     """
 
-    def __init__(self, ucp_endpoint, ucp_worker, config, msg_tag, ctrl_tag):
+    def __init__(self, ucp_endpoint, ucp_worker, config, tag, peer_tag,
+                 blocking_worker=None, peer_info=None, stream=TAG_MSG_STREAM):
         self._ucp_endpoint = ucp_endpoint
         self._ucp_worker = ucp_worker
+        # The worker that the blocking methods progress, only endpoints
+        # created by `connect()` have one
+        self._blocking_worker = blocking_worker
         self._config = config
-        self._msg_tag = msg_tag
-        self._ctrl_tag = ctrl_tag
+        self._stream = stream
+        self._set_tags(tag, peer_tag)
+        # What the peer told about itself in the handshake
+        self._peer_info = peer_info
         self._send_count = 0
         self._recv_count = 0
         self._closed = False
-        self.pending_msg_list = []
+        # The operations in flight on this endpoint
+        self._inflight = RequestRegistry(ucp_worker)
+        # The remote keys unpacked on this endpoint, which must
+        # be destroyed before the endpoint is closed
+        self._rkeys = weakref.WeakSet()
+        # The channels of this endpoint, which close along with it
+        self._channels = weakref.WeakSet()
         # UCX supports CUDA if "cuda" is part of the TLS
         self._cuda_support = "cuda" in config['TLS']
 
@@ -386,6 +1481,16 @@ class _Endpoint:
     def uid(self):
         return self._ucp_endpoint
 
+    def _set_tags(self, tag, peer_tag):
+        """Sets the tag this endpoint receives on and the tag its peer
+        receives on, see `_allocate_tag()`"""
+        self._tag = tag
+        self._peer_tag = peer_tag
+        self._send_tag = peer_tag | self._stream
+        self._recv_tag = tag | self._stream
+        self._ctrl_send_tag = peer_tag | TAG_CTRL_STREAM
+        self._ctrl_recv_tag = tag | TAG_CTRL_STREAM
+
     async def signal_shutdown(self):
         if self._closed:
             raise UCXCloseError("signal_shutdown() - _Endpoint closed")
@@ -393,90 +1498,412 @@ class _Endpoint:
         # Send a shutdown message to the peer
         cdef uint64_t msg = 42
         cdef uint64_t[::1] msg_mv = <uint64_t[:1:1]>(&msg)
-        log = "[Send shutdown] ep: %s, tag: %s" % (hex(self.uid), hex(self._ctrl_tag))
+        log = "[Send shutdown] ep: %s, tag: %s" % (
+            hex(self.uid), hex(self._ctrl_send_tag)
+        )
         logging.debug(log)
-        self.pending_msg_list.append({'log': log})
         await tag_send(
             self._ucp_endpoint,
             msg_mv, msg_mv.nbytes,
-            self._ctrl_tag,
-            pending_msg=self.pending_msg_list[-1]
+            self._ctrl_send_tag,
+            registry=self._inflight, log=log
         )
 
     def closed(self):
         return self._closed
 
-    def close(self):
+    async def flush(self):
+        if self._closed:
+            raise UCXCloseError("flush() - _Endpoint closed")
+        await self._flush()
+
+    def _flush(self):
+        log = "[Flush] ep: %s" % hex(self.uid)
+        logging.debug(log)
+        return ep_flush(self._ucp_endpoint, registry=self._inflight, log=log)
+
+    def close(self, force=False):
         if self._closed:
             raise UCXCloseError("close() - _Endpoint closed")
+        request = self._close(force)
+        if request is not None:
+            # UCX releases the request once the close has completed,
+            # the worker finishes it as it progresses
+            ucp_request_free(<void*> PyLong_AsVoidPtr(request))
+
+    async def aclose(self, force=False):
+        if self._closed:
+            raise UCXCloseError("aclose() - _Endpoint closed")
+        if self._blocking_worker is not None:
+            # Nothing progresses its worker while we await
+            raise UCXError(
+                "aclose() - endpoints created by connect() close with "
+                "close_blocking()"
+            )
+        if not force:
+            try:
+                await self._flush()
+            except UCXError as e:
+                # Nothing left to flush on a failed endpoint
+                logging.debug("_Endpoint.aclose(): %s" % e)
+            if self._closed:  # Closed by the peer in the meantime
+                return
+        op = self._close_wait(force)
+        if op is not None:
+            await op
+
+    def close_blocking(self, force=False):
+        self._check_blocking("close_blocking")
+        if not force:
+            try:
+                self._blocking_worker.wait(self._flush())
+            except UCXError as e:
+                logging.debug("_Endpoint.close_blocking(): %s" % e)
+        op = self._close_wait(force)
+        if op is not None:
+            self._blocking_worker.wait(op)
+
+    def _close_wait(self, force):
+        """Close the endpoint, returns the operation that completes along
+        with the close or None if it completed at once"""
+        request = self._close(force)
+        if request is None:
+            return None
+        # The worker completes the close as it progresses
+        return ep_close_wait(self._ucp_worker, request,
+                             log="[Close] ep: %s" % hex(self.uid))
+
+    def _close(self, force):
+        """Cancel the operations in flight and close the UCX endpoint,
+        returns the close request or None if it completed at once"""
         self._closed = True
-        logging.debug("_Endpoint.close(): %s" % hex(self.uid))
+        logging.debug("_Endpoint.close(force=%s): %s" % (force, hex(self.uid)))
 
-        cdef ucp_worker_h worker = <ucp_worker_h> PyLong_AsVoidPtr(self._ucp_worker)  # noqa
+        # TODO: make sure that a potential shutdown
+        # message isn't cancelled
+        for channel in list(self._channels):
+            if not channel._closed:
+                channel.close()
+        self._inflight.cancel_all(self._ucp_worker)
 
-        for msg in self.pending_msg_list:
-            if 'future' in msg and not msg['future'].done():
-                # TODO: make sure that a potential shutdown
-                # message isn't cancelled
-                logging.debug("Future cancelling: %s" % msg['log'])
-                ucp_request_cancel(
-                    worker,
-                    PyLong_AsVoidPtr(msg['ucp_request'])
-                )
+        for rkey in list(self._rkeys):
+            rkey.destroy()
 
         cdef ucp_ep_h ep = <ucp_ep_h> PyLong_AsVoidPtr(self._ucp_endpoint)
-        cdef ucs_status_ptr_t status = ucp_ep_close_nb(ep,
-                                                       UCP_EP_CLOSE_MODE_FLUSH)
-        if UCS_PTR_STATUS(status) != UCS_OK:
-            assert not UCS_PTR_IS_ERR(status)
-            # We spinlock here until `status` has finished
-            while ucp_request_check_status(status) != UCS_INPROGRESS:
-                while ucp_worker_progress(worker) != 0:
-                    pass
-            assert not UCS_PTR_IS_ERR(status)
-            ucp_request_free(status)
+        cdef unsigned mode = UCP_EP_CLOSE_MODE_FORCE if force \
+            else UCP_EP_CLOSE_MODE_FLUSH
+        cdef ucs_status_ptr_t status = ucp_ep_close_nb(ep, mode)
+        process_completions()
+        if UCS_PTR_IS_ERR(status):
+            logging.debug(
+                "_Endpoint.close(): %s" % (
+                    <object> ucs_status_string(<ucs_status_t> UCS_PTR_STATUS(status))
+                ).decode("utf-8")
+            )
+            return None
+        if UCS_PTR_STATUS(status) == UCS_OK:
+            return None
+        return PyLong_FromVoidPtr(<void*> status)
 
     def __del__(self):
         if not self._closed:
             self.close()
 
+    def _check_blocking(self, name):
+        if self._closed:
+            raise UCXCloseError("%s() - _Endpoint closed" % name)
+        if self._blocking_worker is None:
+            raise UCXError(
+                "%s() - only endpoints created by connect() can block" % name
+            )
+
     async def send(self, buffer, nbytes=None):
         if self._closed:
             raise UCXCloseError("send() - _Endpoint closed")
-        nbytes = get_buffer_nbytes(buffer, check_min_size=nbytes,
-                                   cuda_support=self._cuda_support)
+        return await self._send(buffer, nbytes)
+
+    def send_blocking(self, buffer, nbytes=None):
+        self._check_blocking("send_blocking")
+        return self._blocking_worker.wait(self._send(buffer, nbytes))
+
+    def _send(self, buffer, nbytes):
+        buffer = get_buffer_array(buffer, check_min_size=nbytes,
+                                  cuda_support=self._cuda_support)
+        nbytes = buffer.nbytes
         log = "[Send #%03d] ep: %s, tag: %s, nbytes: %d" % (
-            self._send_count, hex(self.uid), hex(self._msg_tag), nbytes
+            self._send_count, hex(self.uid), hex(self._send_tag), nbytes
         )
         logging.debug(log)
-        self.pending_msg_list.append({'log': log})
         self._send_count += 1
-        return await tag_send(
+        return tag_send(
             self._ucp_endpoint,
             buffer,
             nbytes,
-            self._msg_tag,
-            pending_msg=self.pending_msg_list[-1]
+            self._send_tag,
+            registry=self._inflight, log=log
         )
 
     async def recv(self, buffer, nbytes=None):
         if self._closed:
             raise UCXCloseError("recv() - _Endpoint closed")
-        nbytes = get_buffer_nbytes(buffer, check_min_size=nbytes,
-                                   cuda_support=self._cuda_support)
+        return await self._recv(buffer, nbytes)
+
+    def recv_blocking(self, buffer, nbytes=None):
+        self._check_blocking("recv_blocking")
+        return self._blocking_worker.wait(self._recv(buffer, nbytes))
+
+    def _recv(self, buffer, nbytes):
+        buffer = get_buffer_array(buffer, check_min_size=nbytes,
+                                  cuda_support=self._cuda_support,
+                                  check_writable=True)
+        nbytes = buffer.nbytes
         log = "[Recv #%03d] ep: %s, tag: %s, nbytes: %d" % (
-            self._recv_count, hex(self.uid), hex(self._msg_tag), nbytes
+            self._recv_count, hex(self.uid), hex(self._recv_tag), nbytes
+        )
+        logging.debug(log)
+        self._recv_count += 1
+        return tag_recv(
+            self._ucp_worker,
+            buffer,
+            nbytes,
+            self._recv_tag,
+            registry=self._inflight, log=log
+        )
+
+    async def send_many(self, buffers):
+        if self._closed:
+            raise UCXCloseError("send_many() - _Endpoint closed")
+        buffers = [
+            get_buffer_array(b, cuda_support=self._cuda_support)
+            for b in buffers
+        ]
+        nbytes = [b.nbytes for b in buffers]
+        log = "[Send #%03d-#%03d] ep: %s, tag: %s, nbytes: %d" % (
+            self._send_count, self._send_count + len(nbytes) - 1,
+            hex(self.uid), hex(self._send_tag), sum(nbytes)
+        )
+        logging.debug(log)
+        self._send_count += len(nbytes)
+        return await tag_send_many(
+            self._ucp_endpoint,
+            buffers,
+            nbytes,
+            self._send_tag,
+            registry=self._inflight, log=log
+        )
+
+    async def recv_many(self, buffers):
+        if self._closed:
+            raise UCXCloseError("recv_many() - _Endpoint closed")
+        buffers = [
+            get_buffer_array(b, cuda_support=self._cuda_support,
+                             check_writable=True)
+            for b in buffers
+        ]
+        nbytes = [b.nbytes for b in buffers]
+        log = "[Recv #%03d-#%03d] ep: %s, tag: %s, nbytes: %d" % (
+            self._recv_count, self._recv_count + len(nbytes) - 1,
+            hex(self.uid), hex(self._recv_tag), sum(nbytes)
+        )
+        logging.debug(log)
+        self._recv_count += len(nbytes)
+        return await tag_recv_many(
+            self._ucp_worker,
+            buffers,
+            nbytes,
+            self._recv_tag,
+            registry=self._inflight, log=log
+        )
+
+    async def send_iov(self, buffers):
+        if self._closed:
+            raise UCXCloseError("send_iov() - _Endpoint closed")
+        buffers = [
+            get_buffer_array(b, cuda_support=self._cuda_support)
+            for b in buffers
+        ]
+        nbytes = [b.nbytes for b in buffers]
+        log = "[Send #%03d] ep: %s, tag: %s, nbytes: %d, iov: %d" % (
+            self._send_count, hex(self.uid), hex(self._send_tag),
+            sum(nbytes), len(nbytes)
+        )
+        logging.debug(log)
+        self._send_count += 1
+        return await tag_send_iov(
+            self._ucp_endpoint,
+            buffers,
+            nbytes,
+            self._send_tag,
+            registry=self._inflight, log=log
+        )
+
+    async def recv_iov(self, buffers):
+        if self._closed:
+            raise UCXCloseError("recv_iov() - _Endpoint closed")
+        buffers = [
+            get_buffer_array(b, cuda_support=self._cuda_support,
+                             check_writable=True)
+            for b in buffers
+        ]
+        nbytes = [b.nbytes for b in buffers]
+        log = "[Recv #%03d] ep: %s, tag: %s, nbytes: %d, iov: %d" % (
+            self._recv_count, hex(self.uid), hex(self._recv_tag),
+            sum(nbytes), len(nbytes)
+        )
+        logging.debug(log)
+        self._recv_count += 1
+        return await tag_recv_iov(
+            self._ucp_worker,
+            buffers,
+            nbytes,
+            self._recv_tag,
+            registry=self._inflight, log=log
+        )
+
+    async def recv_any(self, allocator=bytearray):
+        if self._closed:
+            raise UCXCloseError("recv_any() - _Endpoint closed")
+        log = "[Recv #%03d] ep: %s, tag: %s, nbytes: any" % (
+            self._recv_count, hex(self.uid), hex(self._recv_tag)
         )
         logging.debug(log)
-        self.pending_msg_list.append({'log': log})
         self._recv_count += 1
-        return await tag_recv(
+        return await tag_recv_any(
             self._ucp_worker,
+            self._recv_tag,
+            allocator,
+            registry=self._inflight, log=log
+        )
+
+    async def am_send(self, am_id, header, payload):
+        if self._closed:
+            raise UCXCloseError("am_send() - _Endpoint closed")
+        header = get_buffer_array(header, cuda_support=False)
+        payload = get_buffer_array(payload, cuda_support=False)
+        nbytes = [header.nbytes, payload.nbytes]
+        buffers = [_am_header_fmt.pack(nbytes[0]), header, payload]
+        nbytes.insert(0, _am_header_fmt.size)
+        log = "[AM send] ep: %s, id: %d, nbytes: %d" % (
+            hex(self.uid), am_id, sum(nbytes)
+        )
+        logging.debug(log)
+        return await am_send(
+            self._ucp_endpoint,
+            am_id,
+            buffers,
+            nbytes,
+            registry=self._inflight, log=log
+        )
+
+    def unpack_rkey(self, packed_rkey):
+        if self._closed:
+            raise UCXCloseError("unpack_rkey() - _Endpoint closed")
+        ret = rkey_unpack(self._ucp_endpoint, packed_rkey)
+        self._rkeys.add(ret)
+        return ret
+
+    async def send_rkey(self, region):
+        header = struct.pack("QQ", region.address, region.length)
+        await self.send(header + region.pack_rkey())
+
+    async def recv_rkey(self):
+        msg = bytes(await self.recv_any())
+        remote_addr, nbytes = struct.unpack_from("QQ", msg)
+        return remote_addr, nbytes, self.unpack_rkey(msg[struct.calcsize("QQ"):])
+
+    async def put(self, buffer, remote_addr, rkey, nbytes=None):
+        if self._closed:
+            raise UCXCloseError("put() - _Endpoint closed")
+        buffer = get_buffer_array(buffer, check_min_size=nbytes,
+                                  cuda_support=self._cuda_support)
+        nbytes = buffer.nbytes
+        log = "[Put] ep: %s, remote_addr: %s, nbytes: %d" % (
+            hex(self.uid), hex(remote_addr), nbytes
+        )
+        logging.debug(log)
+        return await rma_put(
+            self._ucp_endpoint,
+            buffer,
+            nbytes,
+            remote_addr,
+            rkey,
+            registry=self._inflight, log=log
+        )
+
+    async def get(self, buffer, remote_addr, rkey, nbytes=None):
+        if self._closed:
+            raise UCXCloseError("get() - _Endpoint closed")
+        buffer = get_buffer_array(buffer, check_min_size=nbytes,
+                                  cuda_support=self._cuda_support,
+                                  check_writable=True)
+        nbytes = buffer.nbytes
+        log = "[Get] ep: %s, remote_addr: %s, nbytes: %d" % (
+            hex(self.uid), hex(remote_addr), nbytes
+        )
+        logging.debug(log)
+        return await rma_get(
+            self._ucp_endpoint,
             buffer,
             nbytes,
-            self._msg_tag,
-            pending_msg=self.pending_msg_list[-1]
+            remote_addr,
+            rkey,
+            registry=self._inflight, log=log
+        )
+
+    def atomic_add(self, remote_addr, rkey, value):
+        if self._closed:
+            raise UCXCloseError("atomic_add() - _Endpoint closed")
+        logging.debug("[Atomic add] ep: %s, remote_addr: %s, value: %d" % (
+            hex(self.uid), hex(remote_addr), value)
+        )
+        atomic_add(self._ucp_endpoint, value, remote_addr, rkey)
+
+    async def fetch_add(self, remote_addr, rkey, value):
+        if self._closed:
+            raise UCXCloseError("fetch_add() - _Endpoint closed")
+        result = array.array("Q", [0])
+        log = "[Atomic fetch_add] ep: %s, remote_addr: %s, value: %d" % (
+            hex(self.uid), hex(remote_addr), value
+        )
+        logging.debug(log)
+        await atomic_fetch_add(
+            self._ucp_endpoint,
+            value,
+            result,
+            remote_addr,
+            rkey,
+            registry=self._inflight, log=log
         )
+        return result[0]
+
+    async def compare_swap(self, remote_addr, rkey, compare, swap):
+        if self._closed:
+            raise UCXCloseError("compare_swap() - _Endpoint closed")
+        result = array.array("Q", [swap])
+        log = "[Atomic compare_swap] ep: %s, remote_addr: %s, " \
+              "compare: %d, swap: %d" % (
+                  hex(self.uid), hex(remote_addr), compare, swap
+              )
+        logging.debug(log)
+        await atomic_compare_swap(
+            self._ucp_endpoint,
+            compare,
+            result,
+            remote_addr,
+            rkey,
+            registry=self._inflight, log=log
+        )
+        return result[0]
+
+    def channel(self, n):
+        if self._closed:
+            raise UCXCloseError("channel() - _Endpoint closed")
+        if not 0 < n <= TAG_STREAM_MASK - TAG_MSG_STREAM:
+            raise ValueError("channel must be between 1 and %d" %
+                             (TAG_STREAM_MASK - TAG_MSG_STREAM))
+        ret = _Channel(self, n)
+        self._channels.add(ret)
+        return ret
 
     def ucx_info(self):
         if self._closed:
@@ -504,3 +1931,44 @@ class _Endpoint:
 
     def get_ucp_endpoint(self):
         return self._ucp_endpoint
+
+
+class _Channel(_Endpoint):
+    """A logical channel of an _Endpoint, which shares its connection but
+    sends and receives on tags of its own
+
+    See <..public_api.Endpoint.channel> for documentation
+    """
+
+    def __init__(self, ep, n):
+        super().__init__(
+            ep._ucp_endpoint,
+            ep._ucp_worker,
+            ep._config,
+            ep._tag,
+            ep._peer_tag,
+            blocking_worker=ep._blocking_worker,
+            peer_info=ep._peer_info,
+            stream=TAG_MSG_STREAM + n,
+        )
+        self._parent = ep
+        self._rkeys = ep._rkeys
+
+    async def signal_shutdown(self):
+        await self._parent.signal_shutdown()
+
+    async def flush(self):
+        await self._parent.flush()
+
+    def close(self, force=False):
+        # Only the operations of the channel end, not the connection
+        if self._closed:
+            raise UCXCloseError("close() - _Channel closed")
+        self._closed = True
+        self._inflight.cancel_all(self._ucp_worker)
+
+    async def aclose(self, force=False):
+        self.close(force=force)
+
+    def channel(self, n):
+        return self._parent.channel(n)
@@ -2,17 +2,21 @@
 # See file LICENSE for terms.
 # cython: language_level=3
 
-from libc.string cimport memset
+from libc.string cimport memset, memcpy
 from libc.stdint cimport *
 from libc.stdlib cimport malloc, free
+from posix.stdlib cimport posix_memalign
 from libc.stdio cimport FILE, stdin, stdout, stderr, printf, fflush, fclose
 from posix.stdio cimport open_memstream
+from posix.unistd cimport close
 from cpython.long cimport PyLong_AsVoidPtr, PyLong_FromVoidPtr
 from cpython.ref cimport PyObject, Py_INCREF, Py_DECREF
 
 
 cdef extern from "Python.h":
     Py_buffer* PyMemoryView_GET_BUFFER(PyObject *mview)
+    object PyMemoryView_FromMemory(char *mem, Py_ssize_t size, int flags)
+    int PyBUF_READ
 
 
 cdef extern from "src/c_util.h":
@@ -64,6 +68,7 @@ cdef extern from "ucp/api/ucp.h":
     ucs_status_t UCS_ERR_CANCELED
     ucs_status_t UCS_INPROGRESS
     ucs_status_t UCS_ERR_NO_ELEM
+    ucs_status_t UCS_ERR_BUSY
 
     void ucp_get_version(unsigned * major_version,
                          unsigned *minor_version,
@@ -81,6 +86,9 @@ cdef extern from "ucp/api/ucp.h":
     int UCP_FEATURE_TAG
     int UCP_FEATURE_WAKEUP
     int UCP_FEATURE_STREAM
+    int UCP_FEATURE_RMA
+    int UCP_FEATURE_AM
+    int UCP_FEATURE_AMO64
     ucs_status_t ucp_init(const ucp_params_t *params,
                           const ucp_config_t *config,
                           ucp_context_h *context_p)
@@ -137,8 +145,13 @@ cdef extern from "ucp/api/ucp.h":
                                      ucp_tag_t tag, ucp_send_callback_t cb)
 
     ucp_datatype_t ucp_dt_make_contig(size_t elem_size)
+    ucp_datatype_t ucp_dt_make_iov()
 
-    unsigned ucp_worker_progress(ucp_worker_h worker)
+    ctypedef struct ucp_dt_iov_t:
+        void *buffer
+        size_t length
+
+    unsigned ucp_worker_progress(ucp_worker_h worker) nogil
 
     ctypedef struct ucp_tag_recv_info_t:
         ucp_tag_t sender_tag
@@ -153,6 +166,18 @@ cdef extern from "ucp/api/ucp.h":
                                      ucp_tag_t tag, ucp_tag_t tag_mask,
                                      ucp_tag_recv_callback_t cb)
 
+    ctypedef void* ucp_tag_message_h
+
+    ucp_tag_message_h ucp_tag_probe_nb(ucp_worker_h worker, ucp_tag_t tag,
+                                       ucp_tag_t tag_mask, int remove,
+                                       ucp_tag_recv_info_t *info)
+
+    ucs_status_ptr_t ucp_tag_msg_recv_nb(ucp_worker_h worker, void *buffer,
+                                         size_t count,
+                                         ucp_datatype_t datatype,
+                                         ucp_tag_message_h message,
+                                         ucp_tag_recv_callback_t cb)
+
     ctypedef void (*ucp_stream_recv_callback_t)(void *request,  # noqa
                                                 ucs_status_t status,
                                                 size_t length)
@@ -171,6 +196,8 @@ cdef extern from "ucp/api/ucp.h":
     void ucp_ep_print_info(ucp_ep_h ep, FILE *stream)
 
     ucs_status_t ucp_worker_get_efd(ucp_worker_h worker, int *fd)
+    ucs_status_t ucp_worker_arm(ucp_worker_h worker) nogil
+    ucs_status_t ucp_worker_signal(ucp_worker_h worker)
 
     void ucp_listener_destroy(ucp_listener_h listener)
 
@@ -179,6 +206,8 @@ cdef extern from "ucp/api/ucp.h":
     unsigned UCP_EP_CLOSE_MODE_FORCE
     unsigned UCP_EP_CLOSE_MODE_FLUSH
     ucs_status_ptr_t ucp_ep_close_nb(ucp_ep_h ep, unsigned mode)
+    ucs_status_ptr_t ucp_ep_flush_nb(ucp_ep_h ep, unsigned flags,
+                                     ucp_send_callback_t cb)
 
     void ucp_request_cancel(ucp_worker_h worker, void *request)
     ucs_status_t ucp_request_check_status(void *request)
@@ -198,6 +227,73 @@ cdef extern from "ucp/api/ucp.h":
     ucs_status_t ucp_config_modify(ucp_config_t *config, const char *name,
                                    const char *value)
 
+    ctypedef void* ucp_mem_h
+
+    ctypedef struct ucp_mem_map_params_t:
+        uint64_t field_mask
+        void *address
+        size_t length
+        unsigned flags
+
+    int UCP_MEM_MAP_PARAM_FIELD_ADDRESS
+    int UCP_MEM_MAP_PARAM_FIELD_LENGTH
+    int UCP_MEM_MAP_PARAM_FIELD_FLAGS
+
+    ucs_status_t ucp_mem_map(ucp_context_h context,
+                             const ucp_mem_map_params_t *params,
+                             ucp_mem_h *memh_p)
+    ucs_status_t ucp_mem_unmap(ucp_context_h context, ucp_mem_h memh)
+
+    ctypedef void* ucp_rkey_h
+
+    ucs_status_t ucp_rkey_pack(ucp_context_h context, ucp_mem_h memh,
+                               void **rkey_buffer_p, size_t *size_p)
+    void ucp_rkey_buffer_release(void *rkey_buffer)
+    ucs_status_t ucp_ep_rkey_unpack(ucp_ep_h ep, const void *rkey_buffer,
+                                    ucp_rkey_h *rkey_p)
+    void ucp_rkey_destroy(ucp_rkey_h rkey)
+
+    ucs_status_ptr_t ucp_put_nb(ucp_ep_h ep, const void *buffer,
+                                size_t length, uint64_t remote_addr,
+                                ucp_rkey_h rkey, ucp_send_callback_t cb)
+    ucs_status_ptr_t ucp_get_nb(ucp_ep_h ep, void *buffer, size_t length,
+                                uint64_t remote_addr, ucp_rkey_h rkey,
+                                ucp_send_callback_t cb)
+
+    ctypedef ucs_status_t (*ucp_am_callback_t)(void *arg, void *data,  # noqa
+                                               size_t length,
+                                               ucp_ep_h reply_ep,
+                                               unsigned flags)
+    unsigned UCP_AM_FLAG_WHOLE_MSG
+    unsigned UCP_AM_SEND_REPLY
+    unsigned UCP_CB_PARAM_FLAG_DATA
+
+    ucs_status_t ucp_worker_set_am_handler(ucp_worker_h worker, uint16_t id,
+                                           ucp_am_callback_t cb, void *arg,
+                                           uint32_t flags)
+    void ucp_am_data_release(ucp_worker_h worker, void *data)
+    ucs_status_ptr_t ucp_am_send_nb(ucp_ep_h ep, uint16_t id,
+                                    const void *buffer, size_t count,
+                                    ucp_datatype_t datatype,
+                                    ucp_send_callback_t cb, unsigned flags)
+
+    ctypedef enum ucp_atomic_post_op_t:
+        UCP_ATOMIC_POST_OP_ADD
+
+    ctypedef enum ucp_atomic_fetch_op_t:
+        UCP_ATOMIC_FETCH_OP_FADD
+        UCP_ATOMIC_FETCH_OP_CSWAP
+
+    ucs_status_t ucp_atomic_post(ucp_ep_h ep, ucp_atomic_post_op_t opcode,
+                                 uint64_t value, size_t op_size,
+                                 uint64_t remote_addr, ucp_rkey_h rkey)
+    ucs_status_ptr_t ucp_atomic_fetch_nb(ucp_ep_h ep,
+                                         ucp_atomic_fetch_op_t opcode,
+                                         uint64_t value, void *result,
+                                         size_t op_size, uint64_t remote_addr,
+                                         ucp_rkey_h rkey,
+                                         ucp_send_callback_t cb)
+
 cdef extern from "sys/epoll.h":
 
     cdef enum:
@@ -230,7 +326,27 @@ cdef extern from "sys/epoll.h":
 
     int epoll_create(int size)
     int epoll_ctl(int epfd, int op, int fd, epoll_event *event)
-    int epoll_wait(int epfd, epoll_event *events, int maxevents, int timeout)
+    int epoll_wait(int epfd, epoll_event *events,
+                   int maxevents, int timeout) nogil
+
+
+cdef extern from "src/c_util.h":
+    ctypedef struct c_util_completion_t:
+        void *request
+        ucs_status_t status
+        size_t length
+        int kind
+
+    ctypedef struct c_util_completion_ring_t:
+        pass
+
+    int c_util_completion_ring_push(c_util_completion_ring_t *ring,
+                                    void *request,
+                                    ucs_status_t status,
+                                    size_t length,
+                                    int kind) nogil
+    int c_util_completion_ring_pop(c_util_completion_ring_t *ring,
+                                   c_util_completion_t *completion)
 
 
 cdef struct ucp_request:
@@ -3,100 +3,707 @@
 # cython: language_level=3
 
 import asyncio
+import collections
+import contextvars
 import logging
+import threading
 import uuid
 from core_dep cimport *
-from .utils import get_buffer_data
+from .utils import get_buffer_array
 from ..exceptions import UCXError, UCXCanceled
 
-cdef create_future_from_comm_status(ucs_status_ptr_t status,
-                                    size_t expected_receive,
-                                    pending_msg):
-    ret = asyncio.get_event_loop().create_future()
-    if UCS_PTR_STATUS(status) == UCS_OK:
-        ret.set_result(True)
-    else:
+cdef class RequestRegistry:
+    """The in-flight operations of an endpoint
+
+    Operations are stored in a slot array and remove themselves when they
+    finish, thus the registry only grows with the number of operations in
+    flight at the same time and not with the number of operations ever made.
+    """
+    cdef:
+        list slots
+        list free_slots
+        readonly Py_ssize_t nlive
+        # The worker the operations are made on, if known
+        readonly object worker
+
+    def __init__(self, ucp_worker=None):
+        self.worker = ucp_worker
+        self.slots = []
+        self.free_slots = []
+        self.nlive = 0
+
+    cdef Py_ssize_t add(self, _Operation op):
+        cdef Py_ssize_t slot
+        if len(self.free_slots) > 0:
+            slot = self.free_slots.pop()
+            self.slots[slot] = op
+        else:
+            slot = len(self.slots)
+            self.slots.append(op)
+        self.nlive += 1
+        return slot
+
+    cdef remove(self, Py_ssize_t slot):
+        self.slots[slot] = None
+        self.free_slots.append(slot)
+        self.nlive -= 1
+
+    def __len__(self):
+        return self.nlive
+
+    def capacity(self):
+        """Returns the number of slots, i.e. the peak number of operations
+        in flight at the same time"""
+        return len(self.slots)
+
+    def cancel_all(self, ucp_worker):
+        """Cancel all operations in flight"""
+        cdef ucp_worker_h worker = <ucp_worker_h> PyLong_AsVoidPtr(ucp_worker)
+        cdef _Operation op
+        for op in [op for op in self.slots if op is not None]:
+            logging.debug("Future cancelling: %s" % op.log)
+            op.cancel_requests(worker)
+
+
+cdef class _Operation:
+    """The completion state of an operation of zero or more UCX requests
+
+    All requests of the operation report to this object, which completes
+    once the last of them has finished. Operations given a registry are
+    stored in it while in flight.
+
+    The operation is awaited directly, it implements the parts of the
+    `asyncio.Future` interface that tasks, `asyncio.gather()` and the like
+    use. Awaiting an operation that has already completed, e.g. a send
+    that UCX finished at once, returns without scheduling anything. A
+    task waiting on the operation is woken up by a callback scheduled on
+    the event loop when the operation completes.
+    """
+    cdef:
+        bint done_
+        bint cancelled_
+        object exception_
+        # The value the operation resolves to on success
+        object result_
+        set requests
+        # Objects that must stay alive until all requests have finished
+        object keep_alive
+        # The `_IovVector`s of staged receive buffers, unpacked once all
+        # requests have finished successfully
+        list staged
+        RequestRegistry registry
+        Py_ssize_t slot
+        readonly object log
+        # The worker of the tag receives of the operation, which are
+        # canceled along with it
+        object recv_worker
+        # The event loop the operation completes on, None if it was made
+        # outside of one and nothing has waited for it yet
+        object loop
+        list callbacks
+        public object _asyncio_future_blocking
+        # Unretrieved exceptions are never logged, see `asyncio.Future`
+        public bint _log_traceback
+
+    def __init__(self, registry=None, log=None, keep_alive=None,
+                 recv_worker=None):
+        self.done_ = False
+        self.cancelled_ = False
+        self.exception_ = None
+        self.result_ = True
+        self.requests = set()
+        self.keep_alive = keep_alive
+        self.staged = None
+        self.log = log
+        self.recv_worker = recv_worker
+        try:
+            self.loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # E.g. the operations of the blocking API
+            self.loop = None
+        self.callbacks = None
+        self._asyncio_future_blocking = False
+        self._log_traceback = False
+        self.registry = registry
+        if registry is not None:
+            self.slot = self.registry.add(self)
+
+    cdef add(self, ucs_status_ptr_t status, size_t expected_receive):
+        """Adds the request of `status` to the operation. Returns False if
+        `status` is an error, which the operation then fails with."""
+        if UCS_PTR_IS_ERR(status):
+            msg = (<object> ucs_status_string(
+                <ucs_status_t> UCS_PTR_STATUS(status)
+            )).decode("utf-8")
+            if self.log is not None:
+                msg = "%s: %s" % (self.log, msg)
+            if self.exception_ is None:
+                self.exception_ = UCXError(msg)
+            return False
+        if UCS_PTR_STATUS(status) == UCS_OK:
+            return True
         req = <ucp_request*> status
         if req.finished:
-            ret.set_result(True)
             req.finished = False
             req.future = NULL
             req.expected_receive = 0
+            ucp_request_free(status)
         else:
-            Py_INCREF(ret)
-            req.future = <void*> ret
+            Py_INCREF(self)
+            req.future = <void*> self
             req.expected_receive = expected_receive
-            if pending_msg is not None:
-                pending_msg['future'] = ret
-                pending_msg['ucp_request'] = PyLong_FromVoidPtr(<void*>req)
-                pending_msg['expected_receive'] = expected_receive
+            self.requests.add(PyLong_FromVoidPtr(<void*>req))
+        return True
+
+    cdef finish(self, ucp_request *req, exception):
+        self.requests.discard(PyLong_FromVoidPtr(<void*>req))
+        if exception is not None and self.exception_ is None:
+            self.exception_ = exception
+        self.seal()
+
+    cdef seal(self):
+        """Complete the operation if all requests have finished"""
+        if len(self.requests) > 0:
+            return
+        if (self.staged is not None and not self.done_
+                and self.exception_ is None):
+            try:
+                for iov in self.staged:
+                    iov.unpack()
+            except MemoryError as e:
+                self.exception_ = e
+        self._complete()
+        self._release()
+
+    cdef fail(self, exception):
+        """Complete the operation with `exception` before any request
+        is made"""
+        if self.exception_ is None:
+            self.exception_ = exception
+        self._complete()
+        self._release()
+
+    cdef _complete(self):
+        if self.done_:
+            return
+        self.done_ = True
+        if self.callbacks is not None:
+            # Nothing runs the callbacks anymore once the loop is closed
+            if not self.loop.is_closed():
+                for func, context in self.callbacks:
+                    self.loop.call_soon(func, self, context=context)
+            self.callbacks = None
+
+    cdef _release(self):
+        self.keep_alive = None
+        if self.registry is not None:
+            self.registry.remove(self.slot)
+            self.registry = None
+
+    cdef cancel_requests(self, ucp_worker_h worker):
+        # Released by the operation when it completes
+        cdef RequestRegistry registry = self.registry
+        if len(self.requests) == 0:
+            # E.g. a `tag_recv_any()` still waiting for its message
+            self.fail(UCXCanceled())
+        for req in list(self.requests):
+            ucp_request_cancel(worker, PyLong_AsVoidPtr(req))
+        _process_completions()
+        _wakeup(registry)
+
+    cdef post(self):
+        """Returns the operation to await, call when all requests have
+        been made"""
+        _wakeup(self.registry)
+        _process_completions()
+        self.seal()
+        return self
+
+    # The `asyncio.Future` interface
+
+    def __await__(self):
+        if not self.done_:
+            if self.loop is None:
+                self.loop = asyncio.get_running_loop()
+            self._asyncio_future_blocking = True
+            yield self
+        return self.result()
+
+    __iter__ = __await__
+
+    def get_loop(self):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        return self.loop
+
+    def done(self):
+        return self.done_
+
+    def cancelled(self):
+        return self.cancelled_
+
+    def result(self):
+        if not self.done_:
+            raise asyncio.InvalidStateError("Result is not ready.")
+        if self.exception_ is not None:
+            raise self.exception_
+        return self.result_
+
+    def _make_cancelled_error(self):
+        # Used by `asyncio.gather()` when the operation is canceled
+        return asyncio.CancelledError(*self.exception_.args)
+
+    def exception(self):
+        if not self.done_:
+            raise asyncio.InvalidStateError("Exception is not set.")
+        if self.cancelled_:
+            raise self.exception_
+        return self.exception_
+
+    def add_done_callback(self, fn, *, context=None):
+        loop = self.get_loop()
+        if context is None:
+            context = contextvars.copy_context()
+        if self.done_:
+            loop.call_soon(fn, self, context=context)
+        else:
+            if self.callbacks is None:
+                self.callbacks = []
+            self.callbacks.append((fn, context))
+
+    def remove_done_callback(self, fn):
+        if self.callbacks is None:
+            return 0
+        count = len(self.callbacks)
+        self.callbacks = [(f, c) for f, c in self.callbacks if f != fn]
+        return count - len(self.callbacks)
+
+    def cancel(self, msg=None):
+        """Stops waiting for the operation. Its tag receives are canceled,
+        lest they take the next messages, its other requests keep going and
+        their buffers are kept alive until they have finished."""
+        if self.done_:
+            return False
+        self.cancelled_ = True
+        self.exception_ = asyncio.CancelledError(msg)
+        self._complete()
+        if self.recv_worker is not None:
+            self.cancel_requests(
+                <ucp_worker_h> PyLong_AsVoidPtr(self.recv_worker)
+            )
+        elif len(self.requests) == 0:
+            self._release()
+        return True
+
+
+cdef void *_buffer_ptr(buffer, bint check_writable) except? NULL:
+    """Returns the data pointer of `buffer`, which may be a resolved `Array`"""
+    arr = get_buffer_array(buffer, check_writable=check_writable)
+    if not arr.contiguous:
+        raise ValueError("Array must be contiguous")
+    return PyLong_AsVoidPtr(arr.ptr)
+
+
+cdef size_t _strided_segments(arr, ucp_dt_iov_t *iov) except? 0:
+    """Returns the number of contiguous segments of the strided `arr`, zero
+    if it is empty, and, unless `iov` is NULL, writes them to `iov` in
+    C order
+
+    Trailing dimensions that are contiguous are merged into the segments
+    thus e.g. a slice of rows of a C-order matrix is a few large segments.
+    """
+    cdef tuple shape = arr.shape
+    cdef tuple strides = arr.strides
+    cdef Py_ssize_t seg = arr.itemsize
+    cdef int k = len(shape)
+    cdef int d
+    while k > 0 and (shape[k-1] == 1 or strides[k-1] == seg):
+        seg *= shape[k-1]
+        k -= 1
+    cdef size_t count = 1
+    for d in range(k):
+        count *= shape[d]
+    if count == 0 or seg == 0:
+        return 0
+    if iov == NULL:
+        return count
+
+    # Walk the first `k` dimensions like an odometer
+    cdef Py_ssize_t *idx = <Py_ssize_t*> malloc(3 * k * sizeof(Py_ssize_t))
+    if idx == NULL:
+        raise MemoryError("Failed allocation of strided segments")
+    cdef Py_ssize_t *shp = idx + k
+    cdef Py_ssize_t *strd = idx + 2 * k
+    for d in range(k):
+        idx[d] = 0
+        shp[d] = shape[d]
+        strd[d] = strides[d]
+    cdef char *base = <char*> PyLong_AsVoidPtr(arr.ptr)
+    cdef Py_ssize_t offset = 0
+    cdef size_t i
+    for i in range(count):
+        iov[i].buffer = base + offset
+        iov[i].length = seg
+        d = k - 1
+        while d >= 0:
+            idx[d] += 1
+            offset += strd[d]
+            if idx[d] < shp[d]:
+                break
+            offset -= strd[d] * shp[d]
+            idx[d] = 0
+            d -= 1
+    free(idx)
+    return count
+
+
+cdef _strided_copy(arr, char *packed, bint pack):
+    """Copies the strided `arr` to `packed` in C order if `pack`,
+    otherwise the other way around"""
+    cdef size_t count = _strided_segments(arr, NULL)
+    if count == 0:
+        return
+    cdef ucp_dt_iov_t *iov = <ucp_dt_iov_t*> malloc(
+        count * sizeof(ucp_dt_iov_t)
+    )
+    if iov == NULL:
+        raise MemoryError("Failed allocation of strided segments")
+    cdef size_t i
+    try:
+        _strided_segments(arr, iov)
+        with nogil:
+            for i in range(count):
+                if pack:
+                    memcpy(packed, iov[i].buffer, iov[i].length)
+                else:
+                    memcpy(iov[i].buffer, packed, iov[i].length)
+                packed += iov[i].length
+    finally:
+        free(iov)
+
+
+# Strided buffers of smaller segments are packed into a contiguous staging
+# buffer, a descriptor per segment costs UCX more than copying them
+_MIN_SEGMENT_SIZE = 256
+
+
+cdef class _IovVector:
+    """An array of UCX iov descriptors pointing into `buffers`
+
+    Contiguous buffers are described by one descriptor of `nbytes[i]`
+    bytes and strided buffers by one descriptor per contiguous segment.
+    Strided buffers of tiny segments, e.g. a column of a matrix, are
+    copied to a staging buffer described by one descriptor instead, see
+    `unpack()` for receives. The descriptors and the buffers are kept
+    alive for as long as this object exist.
+    """
+    cdef:
+        ucp_dt_iov_t *iov
+        size_t count
+        size_t nbytes
+        list buffers
+        char *staging
+        # The (buffer, offset in `staging`) of the staged buffers
+        readonly list staged
+
+    def __cinit__(self, buffers, nbytes, check_writable):
+        self.buffers = [
+            get_buffer_array(b, check_writable=check_writable)
+            for b in buffers
+        ]
+        self.count = 0
+        self.nbytes = 0
+        self.staging = NULL
+        self.staged = []
+        cdef size_t staging_size = 0
+        for arr in self.buffers:
+            if arr.contiguous:
+                n = 1
+            else:
+                n = _strided_segments(arr, NULL)
+                if n > 0 and arr.nbytes // n < _MIN_SEGMENT_SIZE:
+                    self.staged.append((arr, staging_size))
+                    staging_size += arr.nbytes
+                    n = 1
+            self.count += n
+        self.iov = <ucp_dt_iov_t*> malloc(
+            max(self.count, 1) * sizeof(ucp_dt_iov_t)
+        )
+        if self.iov == NULL:
+            raise MemoryError("Failed allocation of ucp_dt_iov_t")
+        if staging_size > 0:
+            self.staging = <char*> malloc(staging_size)
+            if self.staging == NULL:
+                raise MemoryError("Failed allocation of staging buffer")
+        cdef size_t i = 0
+        cdef size_t k = 0
+        cdef size_t offset
+        for arr, n in zip(self.buffers, nbytes):
+            if arr.contiguous:
+                self.iov[i].buffer = PyLong_AsVoidPtr(arr.ptr)
+                self.iov[i].length = n
+                i += 1
+            elif k < len(self.staged) and self.staged[k][0] is arr:
+                offset = self.staged[k][1]
+                if not check_writable:
+                    _strided_copy(arr, self.staging + offset, True)
+                self.iov[i].buffer = self.staging + offset
+                self.iov[i].length = n
+                i += 1
+                k += 1
+            else:
+                i += _strided_segments(arr, self.iov + i)
+            self.nbytes += n
+
+    def unpack(self):
+        """Copies the received data from the staging buffer to the staged
+        buffers, call when the receive has finished"""
+        for arr, offset in self.staged:
+            _strided_copy(arr, self.staging + <size_t> offset, False)
+
+    def __dealloc__(self):
+        free(self.iov)
+        free(self.staging)
+
+
+# When a worker is progressed by a thread of its own, the work that UCX
+# callbacks would otherwise do directly is appended to the batch of that
+# thread as (function, args) tuples, which is handed over to the event
+# loop by `take_deferred()` and run there by `run_deferred()`.
+_thread_local = threading.local()
+# The workers progressed by a thread of their own, which must be woken up
+# whenever an operation is posted or canceled since the thread might be
+# waiting for events and the operation might need the worker to be
+# progressed or its deferred completion to be handed over.
+cdef set _progress_thread_workers = set()
+
+
+def start_deferring(ucp_worker):
+    """Defers the work of the UCX callbacks called by the current thread,
+    which progresses `ucp_worker` from now on"""
+    _thread_local.batch = []
+    _progress_thread_workers.add(ucp_worker)
+
+
+def stop_deferring(ucp_worker):
+    _thread_local.batch = None
+    _progress_thread_workers.discard(ucp_worker)
+
+
+cdef _wakeup(RequestRegistry registry):
+    """Wakes up the progress thread of the worker of `registry`, or of all
+    workers if `registry` is None"""
+    if not _progress_thread_workers:
+        return
+    if registry is None or registry.worker is None:
+        workers = _progress_thread_workers
+    elif registry.worker in _progress_thread_workers:
+        workers = (registry.worker,)
+    else:
+        return
+    for worker in workers:
+        ucp_worker_signal(<ucp_worker_h> PyLong_AsVoidPtr(worker))
+
+
+def is_deferred():
+    return getattr(_thread_local, "batch", None) is not None
+
+
+def call_deferrable(func, *args):
+    """Calls `func(*args)` now or defers it if the current thread defers"""
+    cdef list batch = getattr(_thread_local, "batch", None)
+    if batch is None:
+        func(*args)
+    else:
+        batch.append((func, args))
+
+
+def take_deferred():
+    """Returns the work deferred by the current thread so far and starts
+    a new batch"""
+    ret = getattr(_thread_local, "batch", None)
+    if ret is not None:
+        # Even an empty batch is replaced, it may be handed over to
+        # the event loop along with the probe waiters
+        _thread_local.batch = []
     return ret
 
-cdef void _send_callback(void *request, ucs_status_t status):
-    cdef ucp_request *req = <ucp_request*> request
+
+def run_deferred(batch):
+    for func, args in batch:
+        func(*args)
+
+
+cdef _finish_request(ucp_request *req, exception):
+    """Report the completion of `req` to its operation and free `req`"""
+    cdef object op = <object> req.future
+    (<_Operation> op).finish(req, exception)
+    Py_DECREF(op)
+    req.future = NULL
+    ucp_request_free(<void*> req)
+
+
+def _finish_deferred_request(req, exception):
+    _finish_request(<ucp_request*> PyLong_AsVoidPtr(req), exception)
+
+
+# The UCX callbacks of requests don't touch Python, which is slow and
+# needs the GIL within the progress of UCX, they only report the
+# completion to the ring buffer of the calling thread. The thread then
+# completes all reported requests in one pass, by calling
+# `process_completions()` after progressing a worker or canceling
+# requests. Operations process the completions when they are posted
+# since UCX might call the callbacks of receives before returning them.
+cdef extern from *:
+    """
+    static __thread c_util_completion_ring_t ucxpy_completions;
+    """
+    c_util_completion_ring_t ucxpy_completions
+
+cdef enum:
+    _SEND_COMPLETION
+    _TAG_RECV_COMPLETION
+    _STREAM_RECV_COMPLETION
+
+_completion_callback_names = (
+    "_send_callback", "_tag_recv_callback", "_stream_recv_callback"
+)
+
+
+cdef void _report_completion(void *request, ucs_status_t status,
+                             size_t length, int kind) nogil:
+    if c_util_completion_ring_push(&ucxpy_completions, request, status,
+                                   length, kind):
+        # The ring is out of memory, complete the request right away
+        _complete_request_with_gil(request, status, length, kind)
+
+
+# Kept out of `_report_completion()` since Cython takes the GIL on the way
+# out of any nogil function with a `with gil` block, which would deadlock
+# with a thread that holds the GIL while waiting for the lock of the worker
+cdef void _complete_request_with_gil(void *request, ucs_status_t status,
+                                     size_t length, int kind) with gil:
+    _complete_request(<ucp_request*> request, status, length, kind)
+
+
+cdef _complete_request(ucp_request *req, ucs_status_t status, size_t length,
+                       int kind):
     if req.future == NULL:
+        # The request finished before its operation got hold of it,
+        # see `_Operation.add()`
         req.finished = True
         return
-    cdef object future = <object> req.future
-    if asyncio.get_event_loop().is_closed():
-        pass
-    elif status == UCS_ERR_CANCELED:
-        future.set_exception(UCXCanceled())
+    exception = None
+    msg = "[%s] " % _completion_callback_names[kind]
+    if status == UCS_ERR_CANCELED:
+        exception = UCXCanceled()
     elif status != UCS_OK:
-        msg = "[_send_callback] "
         msg += (<object> ucs_status_string(status)).decode("utf-8")
-        future.set_exception(UCXError(msg))
+        exception = UCXError(msg)
+    elif kind != _SEND_COMPLETION and length != req.expected_receive:
+        msg += "length mismatch: %d != %d" % (length, req.expected_receive)
+        exception = UCXError(msg)
+    _request_completed(req, exception)
+
+
+cdef _process_completions():
+    cdef c_util_completion_t completion
+    while c_util_completion_ring_pop(&ucxpy_completions, &completion):
+        _complete_request(<ucp_request*> completion.request,
+                          completion.status, completion.length,
+                          completion.kind)
+
+
+def process_completions():
+    """Completes the requests reported by the UCX callbacks called by
+    the current thread so far"""
+    _process_completions()
+
+
+cdef _request_completed(ucp_request *req, exception):
+    cdef list batch = getattr(_thread_local, "batch", None)
+    if batch is None:
+        _finish_request(req, exception)
     else:
-        future.set_result(True)
-    Py_DECREF(future)
-    req.future = NULL
-    ucp_request_free(request)
+        batch.append(
+            (_finish_deferred_request, (PyLong_FromVoidPtr(req), exception))
+        )
+
 
+cdef void _send_callback(void *request, ucs_status_t status) nogil:
+    _report_completion(request, status, 0, _SEND_COMPLETION)
 
-def tag_send(ucp_ep, buffer, nbytes, tag, pending_msg=None):
+
+def tag_send(ucp_ep, buffer, nbytes, tag, registry=None, log=None):
+    buffer = get_buffer_array(buffer)
+    if not buffer.contiguous:
+        return tag_send_iov(ucp_ep, [buffer], [nbytes], tag, registry, log)
     cdef ucp_ep_h ep = <ucp_ep_h> PyLong_AsVoidPtr(ucp_ep)
-    cdef void *data = PyLong_AsVoidPtr(get_buffer_data(buffer,
-                                       check_writable=False))
+    cdef void *data = _buffer_ptr(buffer, False)
     cdef ucs_status_ptr_t status = ucp_tag_send_nb(ep,
                                                    data,
                                                    nbytes,
                                                    ucp_dt_make_contig(1),
                                                    tag,
                                                    _send_callback)
-    assert(not UCS_PTR_IS_ERR(status))
-    return create_future_from_comm_status(status, nbytes, pending_msg)
+    cdef _Operation op = _Operation(registry, log)
+    op.add(status, nbytes)
+    return op.post()
+
+
+cdef list _resolve_batch(buffers, nbytes, bint check_writable):
+    """Resolves all buffers of a batch before any of it is posted thus
+    a buffer that is rejected doesn't leave the batch half posted
+
+    Returns an (owner, data, count, datatype) tuple per buffer, where
+    `owner` keeps the memory at `data` alive. Strided buffers are
+    described by an `_IovVector` of their segments.
+    """
+    cdef list ret = []
+    cdef _IovVector iov
+    for buffer, n in zip(buffers, nbytes):
+        arr = get_buffer_array(buffer, check_writable=check_writable)
+        if arr.contiguous:
+            ret.append((arr, arr.ptr, n, ucp_dt_make_contig(1)))
+        else:
+            iov = _IovVector([arr], [n], check_writable)
+            ret.append((iov, PyLong_FromVoidPtr(iov.iov), iov.count,
+                        ucp_dt_make_iov()))
+    return ret
+
+
+def tag_send_many(ucp_ep, buffers, nbytes, tag, registry=None, log=None):
+    """Send each buffer in `buffers` as a tag message of size `nbytes[i]`
+
+    All sends are posted at once and the returned operation
+    completes when every one of them has finished.
+    """
+    cdef ucp_ep_h ep = <ucp_ep_h> PyLong_AsVoidPtr(ucp_ep)
+    cdef ucp_tag_t ucp_tag = tag
+    cdef list batch = _resolve_batch(buffers, nbytes, False)
+    cdef ucs_status_ptr_t status
+    cdef _Operation op = _Operation(registry, log, keep_alive=batch)
+    for (_, data, count, datatype), n in zip(batch, nbytes):
+        status = ucp_tag_send_nb(ep, PyLong_AsVoidPtr(data), count,
+                                 datatype, ucp_tag, _send_callback)
+        if not op.add(status, n):
+            # The sends posted so far still complete, the operation
+            # fails once they have
+            break
+    return op.post()
 
 
 cdef void _tag_recv_callback(void *request, ucs_status_t status,
-                             ucp_tag_recv_info_t *info):
-    cdef ucp_request *req = <ucp_request*> request
-    if req.future == NULL:
-        req.finished = True
-        return
-    cdef object future = <object> req.future
-    msg = "[_tag_recv_callback] "
-    if asyncio.get_event_loop().is_closed():
-        pass
-    elif status == UCS_ERR_CANCELED:
-        future.set_exception(UCXCanceled())
-    elif status != UCS_OK:
-        msg += (<object> ucs_status_string(status)).decode("utf-8")
-        future.set_exception(UCXError(msg))
-    elif info.length != req.expected_receive:
-        msg += "length mismatch: %d != %d" % (info.length,
-                                              req.expected_receive)
-        future.set_exception(UCXError(msg))
-    else:
-        future.set_result(True)
-    Py_DECREF(future)
-    req.future = NULL
-    ucp_request_free(request)
+                             ucp_tag_recv_info_t *info) nogil:
+    _report_completion(request, status, info.length, _TAG_RECV_COMPLETION)
 
 
-def tag_recv(ucp_worker, buffer, nbytes, tag, pending_msg=None):
+def tag_recv(ucp_worker, buffer, nbytes, tag, registry=None, log=None):
+    buffer = get_buffer_array(buffer, check_writable=True)
+    if not buffer.contiguous:
+        return tag_recv_iov(ucp_worker, [buffer], [nbytes], tag, registry, log)
     cdef ucp_worker_h worker = <ucp_worker_h> PyLong_AsVoidPtr(ucp_worker)
-    cdef void *data = PyLong_AsVoidPtr(get_buffer_data(buffer,
-                                       check_writable=True))
+    cdef void *data = _buffer_ptr(buffer, True)
     cdef ucs_status_ptr_t status = ucp_tag_recv_nb(worker,
                                                    data,
                                                    nbytes,
@@ -104,53 +711,407 @@ def tag_recv(ucp_worker, buffer, nbytes, tag, pending_msg=None):
                                                    tag,
                                                    -1,
                                                    _tag_recv_callback)
-    assert(not UCS_PTR_IS_ERR(status))
-    return create_future_from_comm_status(status, nbytes, pending_msg)
+    cdef _Operation op = _Operation(registry, log, recv_worker=ucp_worker)
+    op.add(status, nbytes)
+    return op.post()
+
+
+def tag_recv_many(ucp_worker, buffers, nbytes, tag, registry=None, log=None):
+    """Receive consecutive tag messages into the buffers of `buffers`
+
+    All receives are posted at once, in order, and the returned operation
+    completes when every one of them has finished.
+    """
+    cdef ucp_worker_h worker = <ucp_worker_h> PyLong_AsVoidPtr(ucp_worker)
+    cdef ucp_tag_t ucp_tag = tag
+    cdef list batch = _resolve_batch(buffers, nbytes, True)
+    cdef ucs_status_ptr_t status
+    cdef _Operation op = _Operation(registry, log, keep_alive=batch,
+                                    recv_worker=ucp_worker)
+    op.staged = [
+        owner for owner, _, _, _ in batch
+        if isinstance(owner, _IovVector) and owner.staged
+    ] or None
+    for (_, data, count, datatype), n in zip(batch, nbytes):
+        status = ucp_tag_recv_nb(worker, PyLong_AsVoidPtr(data), count,
+                                 datatype, ucp_tag, -1, _tag_recv_callback)
+        if not op.add(status, n):
+            # Don't leave the receives posted so far waiting for
+            # messages of the batch that is given up
+            op.cancel_requests(worker)
+            break
+    return op.post()
 
 
-def stream_send(ucp_ep, buffer, nbytes, pending_msg=None):
+def tag_send_iov(ucp_ep, buffers, nbytes, tag, registry=None, log=None):
+    """Send the buffers of `buffers` as one scatter/gather tag message
+
+    The message consists of `nbytes[i]` bytes of each buffer, in order,
+    and is sent without copying the buffers into a contiguous one.
+    """
     cdef ucp_ep_h ep = <ucp_ep_h> PyLong_AsVoidPtr(ucp_ep)
-    cdef void *data = PyLong_AsVoidPtr(get_buffer_data(buffer,
-                                       check_writable=False))
+    cdef _IovVector iov = _IovVector(buffers, nbytes, check_writable=False)
+    cdef ucs_status_ptr_t status = ucp_tag_send_nb(ep,
+                                                   iov.iov,
+                                                   iov.count,
+                                                   ucp_dt_make_iov(),
+                                                   tag,
+                                                   _send_callback)
+    cdef _Operation op = _Operation(registry, log, keep_alive=iov)
+    op.add(status, iov.nbytes)
+    return op.post()
+
+
+def tag_recv_iov(ucp_worker, buffers, nbytes, tag, registry=None, log=None):
+    """Receive one tag message scattered over the buffers of `buffers`
+
+    The message fills `nbytes[i]` bytes of each buffer, in order,
+    and must be exactly `sum(nbytes)` bytes long.
+    """
+    cdef ucp_worker_h worker = <ucp_worker_h> PyLong_AsVoidPtr(ucp_worker)
+    cdef _IovVector iov = _IovVector(buffers, nbytes, check_writable=True)
+    cdef ucs_status_ptr_t status = ucp_tag_recv_nb(worker,
+                                                   iov.iov,
+                                                   iov.count,
+                                                   ucp_dt_make_iov(),
+                                                   tag,
+                                                   -1,
+                                                   _tag_recv_callback)
+    cdef _Operation op = _Operation(registry, log, keep_alive=iov,
+                                    recv_worker=ucp_worker)
+    if iov.staged:
+        op.staged = [iov]
+    op.add(status, iov.nbytes)
+    return op.post()
+
+
+# Receives waiting for a message of unknown size to arrive.
+# Maps a worker address to a dict that maps a tag to a FIFO of
+# (operation, allocator) tuples.
+_probe_waiters = {}
+
+
+def tag_recv_any(ucp_worker, tag, allocator, registry=None, log=None):
+    """Receive the next tag message whatever its size
+
+    Once the message has arrived, `allocator(nbytes)` is called to create
+    a buffer of exactly the size of the message. Returns an operation that
+    resolves to that buffer when the message has been received into it.
+    If `allocator` raises, the operation fails with its exception and the
+    message is discarded.
+    """
+    cdef _Operation op = _Operation(registry, log)
+    tags = _probe_waiters.setdefault(ucp_worker, {})
+    waiters = tags.setdefault(tag, collections.deque())
+    waiters.append((op, allocator))
+    _probe_messages(ucp_worker, tag, waiters)
+    return op
+
+
+def has_probe_waiters(ucp_worker):
+    return bool(_probe_waiters.get(ucp_worker))
+
+
+def tag_probe_waiters(ucp_worker):
+    """Posts receives for the waiting `tag_recv_any()` calls of `ucp_worker`
+    that now have a matching message. Call this after progressing the worker.
+    """
+    tags = _probe_waiters.get(ucp_worker)
+    if tags:
+        for tag, waiters in list(tags.items()):
+            _probe_messages(ucp_worker, tag, waiters)
+            if len(waiters) == 0:
+                del tags[tag]
+
+
+cdef _probe_messages(ucp_worker, ucp_tag_t tag, waiters):
+    cdef ucp_worker_h worker = <ucp_worker_h> PyLong_AsVoidPtr(ucp_worker)
+    cdef ucp_tag_recv_info_t info
+    cdef ucp_tag_message_h msg
+    cdef ucs_status_ptr_t status
+    cdef void *data
+    cdef _Operation op
+    while len(waiters) > 0:
+        op, allocator = waiters[0]
+        if op.done_:  # E.g. canceled by `_Endpoint.close()`
+            waiters.popleft()
+            continue
+        msg = ucp_tag_probe_nb(worker, tag, -1, 1, &info)
+        if msg == NULL:
+            return
+        waiters.popleft()
+        try:
+            buffer = allocator(info.length)
+            arr = get_buffer_array(buffer, check_min_size=info.length,
+                                   check_writable=True)
+            data = _buffer_ptr(arr, True)
+        except Exception as e:
+            # The message is removed from UCX already thus it is still
+            # received, into nothing, which UCX truncates. Otherwise
+            # it would stay in UCX forever.
+            status = ucp_tag_msg_recv_nb(worker, NULL, 0,
+                                         ucp_dt_make_contig(1), msg,
+                                         _tag_recv_callback)
+            _Operation(log=op.log).add(status, 0)
+            op.fail(e)
+            continue
+        status = ucp_tag_msg_recv_nb(worker, data, info.length,
+                                     ucp_dt_make_contig(1), msg,
+                                     _tag_recv_callback)
+        op.result_ = buffer
+        op.add(status, info.length)
+        op.post()
+
+
+# Endpoint closes still in progress, UCX doesn't report when the request
+# of `ucp_ep_close_nb()` finishes thus the workers check them after
+# progressing. Maps a worker address to a list of (request, operation)
+# tuples.
+_close_waiters = {}
+
+
+def ep_close_wait(ucp_worker, request, log=None):
+    """Returns an operation that completes once the close request
+    `request` of an endpoint of `ucp_worker` has finished, which is then
+    freed. Nothing needs to wait for it, canceling the operation doesn't
+    affect the request."""
+    cdef _Operation op = _Operation(log=log)
+    _close_waiters.setdefault(ucp_worker, []).append((request, op))
+    check_close_waiters(ucp_worker)
+    if ucp_worker in _progress_thread_workers:
+        ucp_worker_signal(<ucp_worker_h> PyLong_AsVoidPtr(ucp_worker))
+    return op
+
+
+def has_close_waiters(ucp_worker):
+    return bool(_close_waiters.get(ucp_worker))
+
+
+def check_close_waiters(ucp_worker):
+    """Completes the waiting `ep_close_wait()` calls of `ucp_worker` whose
+    request has finished. Call this after progressing the worker."""
+    waiters = _close_waiters.get(ucp_worker)
+    if not waiters:
+        return
+    cdef _Operation op
+    cdef void *req
+    cdef ucs_status_t status
+    pending = []
+    for request, op in waiters:
+        req = PyLong_AsVoidPtr(request)
+        status = ucp_request_check_status(req)
+        if status == UCS_INPROGRESS:
+            pending.append((request, op))
+            continue
+        ucp_request_free(req)
+        if status != UCS_OK:
+            # E.g. the peer is gone, the endpoint is closed all the same
+            logging.debug("%s: %s" % (
+                op.log, (<object> ucs_status_string(status)).decode("utf-8")
+            ))
+        op.seal()
+    if pending:
+        _close_waiters[ucp_worker] = pending
+    else:
+        del _close_waiters[ucp_worker]
+
+
+def cancel_close_waiters(ucp_worker):
+    """Gives up waiting for the close requests of `ucp_worker`, which UCX
+    releases itself. Call this before destroying the worker."""
+    cdef _Operation op
+    for request, op in _close_waiters.pop(ucp_worker, ()):
+        ucp_request_free(PyLong_AsVoidPtr(request))
+        op.fail(UCXCanceled())
+
+
+cdef class RemoteKey:
+    """A remote key unpacked on an endpoint
+
+    Gives the endpoint access to the memory of the peer that packed it.
+    """
+    cdef:
+        ucp_rkey_h rkey
+        object __weakref__
+
+    def __cinit__(self):
+        self.rkey = NULL
+
+    def destroy(self):
+        if self.rkey != NULL:
+            ucp_rkey_destroy(self.rkey)
+            self.rkey = NULL
+
+    def __dealloc__(self):
+        self.destroy()
+
+
+def rkey_unpack(ucp_ep, bytes packed_rkey):
+    cdef ucp_ep_h ep = <ucp_ep_h> PyLong_AsVoidPtr(ucp_ep)
+    cdef RemoteKey ret = RemoteKey()
+    cdef ucs_status_t status = ucp_ep_rkey_unpack(ep, <char*> packed_rkey,
+                                                  &ret.rkey)
+    if status != UCS_OK:
+        msg = "[ucp_ep_rkey_unpack] "
+        msg += (<object> ucs_status_string(status)).decode("utf-8")
+        raise UCXError(msg)
+    return ret
+
+
+def rma_put(ucp_ep, buffer, nbytes, remote_addr, RemoteKey rkey,
+            registry=None, log=None):
+    """Write `nbytes` of `buffer` to `remote_addr` of the peer
+
+    The returned operation completes when `buffer` can be reused,
+    which doesn't imply that the data has reached the peer.
+    """
+    cdef ucp_ep_h ep = <ucp_ep_h> PyLong_AsVoidPtr(ucp_ep)
+    cdef void *data = _buffer_ptr(buffer, False)
+    if rkey.rkey == NULL:
+        raise UCXError("rma_put() - RemoteKey destroyed")
+    cdef ucs_status_ptr_t status = ucp_put_nb(ep,
+                                              data,
+                                              nbytes,
+                                              remote_addr,
+                                              rkey.rkey,
+                                              _send_callback)
+    cdef _Operation op = _Operation(registry, log)
+    op.add(status, nbytes)
+    return op.post()
+
+
+def rma_get(ucp_ep, buffer, nbytes, remote_addr, RemoteKey rkey,
+            registry=None, log=None):
+    """Read `nbytes` from `remote_addr` of the peer into `buffer`"""
+    cdef ucp_ep_h ep = <ucp_ep_h> PyLong_AsVoidPtr(ucp_ep)
+    cdef void *data = _buffer_ptr(buffer, True)
+    if rkey.rkey == NULL:
+        raise UCXError("rma_get() - RemoteKey destroyed")
+    cdef ucs_status_ptr_t status = ucp_get_nb(ep,
+                                              data,
+                                              nbytes,
+                                              remote_addr,
+                                              rkey.rkey,
+                                              _send_callback)
+    cdef _Operation op = _Operation(registry, log)
+    op.add(status, nbytes)
+    return op.post()
+
+
+def atomic_add(ucp_ep, value, remote_addr, RemoteKey rkey):
+    """Post an atomic add of `value` to the 64-bit word at `remote_addr`
+
+    The add is only posted, it isn't guaranteed to have been applied at
+    the peer before the endpoint is flushed.
+    """
+    cdef ucp_ep_h ep = <ucp_ep_h> PyLong_AsVoidPtr(ucp_ep)
+    if rkey.rkey == NULL:
+        raise UCXError("atomic_add() - RemoteKey destroyed")
+    cdef ucs_status_t status = ucp_atomic_post(ep, UCP_ATOMIC_POST_OP_ADD,
+                                               value, sizeof(uint64_t),
+                                               remote_addr, rkey.rkey)
+    _wakeup(None)
+    if status != UCS_OK:
+        msg = "[ucp_atomic_post] "
+        msg += (<object> ucs_status_string(status)).decode("utf-8")
+        raise UCXError(msg)
+
+
+cdef _atomic_fetch(ucp_ep, ucp_atomic_fetch_op_t opcode, uint64_t value,
+                   result, remote_addr, RemoteKey rkey, registry, log):
+    cdef ucp_ep_h ep = <ucp_ep_h> PyLong_AsVoidPtr(ucp_ep)
+    cdef void *data = _buffer_ptr(result, True)
+    if rkey.rkey == NULL:
+        raise UCXError("atomic operation - RemoteKey destroyed")
+    cdef ucs_status_ptr_t status = ucp_atomic_fetch_nb(ep,
+                                                       opcode,
+                                                       value,
+                                                       data,
+                                                       sizeof(uint64_t),
+                                                       remote_addr,
+                                                       rkey.rkey,
+                                                       _send_callback)
+    cdef _Operation op = _Operation(registry, log, keep_alive=result)
+    op.add(status, sizeof(uint64_t))
+    return op.post()
+
+
+def atomic_fetch_add(ucp_ep, value, result, remote_addr, RemoteKey rkey,
+                     registry=None, log=None):
+    """Atomically add `value` to the 64-bit word at `remote_addr`
+
+    The returned operation completes when the previous value of the remote
+    word has been written to `result`, a writable buffer of one uint64.
+    """
+    return _atomic_fetch(ucp_ep, UCP_ATOMIC_FETCH_OP_FADD, value, result,
+                         remote_addr, rkey, registry, log)
+
+
+def atomic_compare_swap(ucp_ep, compare, result, remote_addr, RemoteKey rkey,
+                        registry=None, log=None):
+    """Atomically replace the 64-bit word at `remote_addr` by the value
+    in `result` if the word equals `compare`
+
+    The returned operation completes when the previous value of the remote
+    word has been written to `result`, a writable buffer of one uint64.
+    """
+    return _atomic_fetch(ucp_ep, UCP_ATOMIC_FETCH_OP_CSWAP, compare, result,
+                         remote_addr, rkey, registry, log)
+
+
+def am_send(ucp_ep, am_id, buffers, nbytes, registry=None, log=None):
+    """Send the buffers of `buffers` as one active message to handler `am_id`
+
+    The message is sent with the reply flag set thus the handler
+    at the peer is given the endpoint the message came from.
+    """
+    cdef ucp_ep_h ep = <ucp_ep_h> PyLong_AsVoidPtr(ucp_ep)
+    cdef _IovVector iov = _IovVector(buffers, nbytes, check_writable=False)
+    cdef ucs_status_ptr_t status = ucp_am_send_nb(ep,
+                                                  am_id,
+                                                  iov.iov,
+                                                  iov.count,
+                                                  ucp_dt_make_iov(),
+                                                  _send_callback,
+                                                  UCP_AM_SEND_REPLY)
+    cdef _Operation op = _Operation(registry, log, keep_alive=iov)
+    op.add(status, iov.nbytes)
+    return op.post()
+
+
+def stream_send(ucp_ep, buffer, nbytes, registry=None, log=None):
+    cdef ucp_ep_h ep = <ucp_ep_h> PyLong_AsVoidPtr(ucp_ep)
+    cdef void *data = _buffer_ptr(buffer, False)
     cdef ucs_status_ptr_t status = ucp_stream_send_nb(ep,
                                                       data,
                                                       nbytes,
                                                       ucp_dt_make_contig(1),
                                                       _send_callback,
                                                       0)
-    assert(not UCS_PTR_IS_ERR(status))
-    return create_future_from_comm_status(status, nbytes, pending_msg)
+    cdef _Operation op = _Operation(registry, log)
+    op.add(status, nbytes)
+    return op.post()
+
+
+def ep_flush(ucp_ep, registry=None, log=None):
+    """Returns an operation that finishes once all operations issued
+    on `ucp_ep` so far have completed, locally and remotely"""
+    cdef ucp_ep_h ep = <ucp_ep_h> PyLong_AsVoidPtr(ucp_ep)
+    cdef ucs_status_ptr_t status = ucp_ep_flush_nb(ep, 0, _send_callback)
+    cdef _Operation op = _Operation(registry, log)
+    # Fails if the endpoint has failed, e.g. because the peer is gone
+    op.add(status, 0)
+    return op.post()
 
 
 cdef void _stream_recv_callback(void *request, ucs_status_t status,
-                                size_t length):
-    cdef ucp_request *req = <ucp_request*> request
-    if req.future == NULL:
-        req.finished = True
-        return
-    cdef object future = <object> req.future
-    msg = "[_stream_recv_callback] "
-    if asyncio.get_event_loop().is_closed():
-        pass
-    elif status == UCS_ERR_CANCELED:
-        future.set_exception(UCXCanceled())
-    elif status != UCS_OK:
-        msg += (<object> ucs_status_string(status)).decode("utf-8")
-        future.set_exception(UCXError(msg))
-    elif length != req.expected_receive:
-        msg += "length mismatch: %d != %d" % (length, req.expected_receive)
-        future.set_exception(UCXError(msg))
-    else:
-        future.set_result(True)
-    Py_DECREF(future)
-    req.future = NULL
-    ucp_request_free(request)
+                                size_t length) nogil:
+    _report_completion(request, status, length, _STREAM_RECV_COMPLETION)
 
 
-def stream_recv(ucp_ep, buffer, nbytes, pending_msg=None):
+def stream_recv(ucp_ep, buffer, nbytes, registry=None, log=None):
     cdef ucp_ep_h ep = <ucp_ep_h> PyLong_AsVoidPtr(ucp_ep)
-    cdef void *data = PyLong_AsVoidPtr(get_buffer_data(buffer,
-                                       check_writable=True))
+    cdef void *data = _buffer_ptr(buffer, True)
     cdef size_t length
     cdef ucp_request *req
     cdef ucs_status_ptr_t status = ucp_stream_recv_nb(ep,
@@ -160,5 +1121,6 @@ def stream_recv(ucp_ep, buffer, nbytes, pending_msg=None):
                                                       _stream_recv_callback,
                                                       &length,
                                                       0)
-    assert(not UCS_PTR_IS_ERR(status))
-    return create_future_from_comm_status(status, nbytes, pending_msg)
+    cdef _Operation op = _Operation(registry, log)
+    op.add(status, nbytes)
+    return op.post()
@@ -70,3 +70,44 @@ int c_util_get_ucp_ep_params(ucp_ep_params_t *param,
 void c_util_get_ucp_ep_params_free(ucp_ep_params_t *param) {
     free((void*) param->sockaddr.addr);
 }
+
+int c_util_completion_ring_push(c_util_completion_ring_t *ring,
+                                void *request,
+                                ucs_status_t status,
+                                size_t length,
+                                int kind) {
+    if(ring->count == ring->capacity) {
+        /* Grow by doubling and move the entries to the front */
+        size_t capacity = ring->capacity == 0 ? 64 : 2 * ring->capacity;
+        c_util_completion_t *entries = malloc(capacity * sizeof(*entries));
+        if(entries == NULL) {
+            return 1;
+        }
+        for(size_t i = 0; i < ring->count; ++i) {
+            entries[i] = ring->entries[(ring->head + i) % ring->capacity];
+        }
+        free(ring->entries);
+        ring->entries  = entries;
+        ring->capacity = capacity;
+        ring->head     = 0;
+    }
+    c_util_completion_t *completion =
+        &ring->entries[(ring->head + ring->count) % ring->capacity];
+    completion->request = request;
+    completion->status  = status;
+    completion->length  = length;
+    completion->kind    = kind;
+    ++ring->count;
+    return 0;
+}
+
+int c_util_completion_ring_pop(c_util_completion_ring_t *ring,
+                               c_util_completion_t *completion) {
+    if(ring->count == 0) {
+        return 0;
+    }
+    *completion = ring->entries[ring->head];
+    ring->head = (ring->head + 1) % ring->capacity;
+    --ring->count;
+    return 1;
+}
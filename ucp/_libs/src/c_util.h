@@ -20,3 +20,30 @@ int c_util_get_ucp_ep_params(ucp_ep_params_t *param,
                              uint16_t port);
 
 void c_util_get_ucp_ep_params_free(ucp_ep_params_t *param);
+
+/* The completion of a UCX request as reported by its callback */
+typedef struct c_util_completion {
+    void *request;
+    ucs_status_t status;
+    /* The received length of receive requests */
+    size_t length;
+    /* Which callback reported the completion */
+    int kind;
+} c_util_completion_t;
+
+/* A growable ring buffer of completions */
+typedef struct c_util_completion_ring {
+    c_util_completion_t *entries;
+    size_t capacity;
+    size_t head;
+    size_t count;
+} c_util_completion_ring_t;
+
+int c_util_completion_ring_push(c_util_completion_ring_t *ring,
+                                void *request,
+                                ucs_status_t status,
+                                size_t length,
+                                int kind);
+
+int c_util_completion_ring_pop(c_util_completion_ring_t *ring,
+                               c_util_completion_t *completion);
@@ -4,51 +4,164 @@
 
 import asyncio
 import uuid
-from functools import reduce
-import operator
 from core_dep cimport *
+from cpython.buffer cimport (
+    PyObject_CheckBuffer, PyObject_GetBuffer, PyBuffer_Release,
+    PyBuffer_IsContiguous, PyBUF_STRIDES
+)
 from ..exceptions import UCXError, UCXCloseError
 
 
-def _data_from_memoryview(object mview):
+cdef class Array:
+    """A buffer resolved into its data pointer, size and memory type
+
+    All properties of the buffer are resolved at once, when the `Array`
+    is created, thus the buffer should be resolved once per operation
+    and the `Array` handed around instead of the buffer itself.
+    Objects that implement the buffer protocol, such as `bytes`,
+    `bytearray`, `memoryview` and NumPy arrays, are resolved without
+    leaving C. Other objects must expose `__cuda_array_interface__`
+    or `__array_interface__`.
+
+    Buffers that aren't C-contiguous are strided: `ptr` points to their
+    first element and `shape`, `strides` and `itemsize` describe their
+    layout. For contiguous buffers `shape` and `strides` are None.
+
+    The `Array` keeps a reference to the buffer in `obj` thus the
+    memory at `ptr` is valid for as long as the `Array` exist.
     """
-    Help function that returns a pointer to the data
-    of ´mview´ as a Python integer.
+    cdef readonly object obj
+    cdef readonly size_t ptr
+    cdef readonly Py_ssize_t nbytes
+    cdef readonly bint writable
+    cdef readonly bint cuda
+    cdef readonly bint contiguous
+    cdef readonly Py_ssize_t itemsize
+    cdef readonly tuple shape
+    cdef readonly tuple strides
+
+    def __cinit__(self, obj):
+        cdef Py_buffer view
+        cdef int i
+        self.obj = obj
+        self.cuda = False
+        if PyObject_CheckBuffer(obj):
+            PyObject_GetBuffer(obj, &view, PyBUF_STRIDES)
+            self.ptr = <size_t> view.buf
+            self.nbytes = view.len
+            self.writable = not view.readonly
+            self.itemsize = view.itemsize
+            self.contiguous = PyBuffer_IsContiguous(&view, b'C')
+            if not self.contiguous:
+                self.shape = tuple([view.shape[i] for i in range(view.ndim)])
+                self.strides = tuple(
+                    [view.strides[i] for i in range(view.ndim)]
+                )
+            PyBuffer_Release(&view)
+        elif hasattr(obj, "__cuda_array_interface__"):
+            self.cuda = True
+            self._from_iface(obj.__cuda_array_interface__)
+        elif hasattr(obj, "__array_interface__"):
+            self._from_iface(obj.__array_interface__)
+        else:
+            raise TypeError(
+                "%s doesn't expose its memory" % type(obj).__name__
+            )
+
+    cdef _from_iface(self, dict iface):
+        data_ptr, data_readonly = iface['data']
+        # Workaround for numba giving None, rather than an 0.
+        # https://github.com/cupy/cupy/issues/2104 for more info.
+        self.ptr = 0 if data_ptr is None else data_ptr
+        self.writable = not data_readonly
+
+        self.itemsize = _typestr_itemsize(iface['typestr'])
+        cdef Py_ssize_t nbytes = self.itemsize
+        # Making sure that the elements in shape is integers
+        shape = tuple([int(s) for s in iface['shape']])
+        for s in shape:
+            nbytes *= s
+        self.nbytes = nbytes
+        # Check whether data is contiguous, dimensions of size one
+        # don't matter whatever their stride
+        self.contiguous = True
+        strides = iface.get("strides", None)
+        if len(shape) > 0 and strides is not None:
+            if len(strides) != len(shape):
+                msg = "The length of shape and strides must be equal"
+                raise ValueError(msg)
+            strides = tuple([int(s) for s in strides])
+            s = self.itemsize
+            for i in reversed(range(len(shape))):
+                if shape[i] != 1 and s != strides[i]:
+                    self.contiguous = False
+                    self.shape = shape
+                    self.strides = strides
+                    break
+                s *= shape[i]
+        if iface.get("mask", None) is not None:
+            raise NotImplementedError("mask attribute not supported")
+
+
+cdef Py_ssize_t _typestr_itemsize(str typestr) except -1:
+    """Returns the item size of an array interface type string
+
+    Only falls back on NumPy for the type strings it can't parse
+    itself, which avoids constructing a dtype for every buffer.
     """
-    cdef Py_buffer* buf = PyMemoryView_GET_BUFFER(<PyObject*>mview)
-    return PyLong_FromVoidPtr(buf.buf)
+    cdef str kind = typestr[1:2]
+    count = typestr[2:].split("[", 1)[0]
+    if count.isdigit():
+        if kind == "U":  # The count of a unicode string is in UCS4 chars
+            return int(count) * 4
+        return int(count)
+    import numpy
+    return int(numpy.dtype(typestr).itemsize)
 
 
-def get_buffer_data(buffer, check_writable=False):
+def get_buffer_array(buffer, check_min_size=None, cuda_support=True,
+                     check_writable=False):
     """
-    Returns data pointer of the buffer. Raising ValueError if the buffer
-    is read only and check_writable=True is set.
+    Resolves `buffer` into an `Array`, or returns it as is if it is one
+    already. Raising ValueError if `check_min_size` is greater than the
+    size of the buffer, if the buffer is CUDA memory and `cuda_support`
+    isn't set or if the buffer is read only and check_writable=True is set.
     """
-    iface = None
-    if hasattr(buffer, "__cuda_array_interface__"):
-        iface = buffer.__cuda_array_interface__
-    elif hasattr(buffer, "__array_interface__"):
-        iface = buffer.__array_interface__
-
-    if iface is not None:
-        data_ptr, data_readonly = iface['data']
+    cdef Array ret
+    if type(buffer) is Array:
+        ret = buffer
     else:
-        mview = memoryview(buffer)
-        data_ptr = _data_from_memoryview(mview)
-        data_readonly = mview.readonly
+        ret = Array(buffer)
+
+    if ret.cuda and not cuda_support:
+        msg = "UCX is not configured with CUDA support, please add " \
+              "`cuda_copy` and/or `cuda_ipc` to " \
+              "the UCX_TLS environment variable"
+        raise ValueError(msg)
 
-    # Workaround for numba giving None, rather than an 0.
-    # https://github.com/cupy/cupy/issues/2104 for more info.
-    if data_ptr is None:
-        data_ptr = 0
+    if ret.cuda and not ret.contiguous:
+        raise ValueError("CUDA arrays must be contiguous")
 
-    if data_ptr == 0:
+    if ret.ptr == 0:
         raise NotImplementedError("zero-sized buffers isn't supported")
 
-    if check_writable and data_readonly:
+    if check_writable and not ret.writable:
         raise ValueError("writing to readonly buffer!")
 
-    return data_ptr
+    if check_min_size is not None and ret.nbytes < check_min_size:
+        raise ValueError("the nbytes is greater than the size of the buffer!")
+    return ret
+
+
+def get_buffer_data(buffer, check_writable=False):
+    """
+    Returns data pointer of the buffer. Raising ValueError if the buffer
+    is read only and check_writable=True is set.
+    """
+    cdef Array arr = get_buffer_array(buffer, check_writable=check_writable)
+    if not arr.contiguous:
+        raise ValueError("Array must be contiguous")
+    return arr.ptr
 
 
 def get_buffer_nbytes(buffer, check_min_size, cuda_support):
@@ -56,44 +169,14 @@ def get_buffer_nbytes(buffer, check_min_size, cuda_support):
     Returns the size of the buffer in bytes. Returns ValueError
     if `check_min_size` is greater than the size of the buffer
     """
-
-    iface = None
-    if hasattr(buffer, "__cuda_array_interface__"):
-        iface = buffer.__cuda_array_interface__
-        if not cuda_support:
-            msg = "UCX is not configured with CUDA support, please add " \
-                  "`cuda_copy` and/or `cuda_ipc` to " \
-                  "the UCX_TLS environment variable"
-            raise ValueError(msg)
-    elif hasattr(buffer, "__array_interface__"):
-        iface = buffer.__array_interface__
-
-    if iface is not None:
-        import numpy
-        itemsize = int(numpy.dtype(iface['typestr']).itemsize)
-        # Making sure that the elements in shape is integers
-        shape = [int(s) for s in iface['shape']]
-        nbytes = reduce(operator.mul, shape, 1) * itemsize
-        # Check that data is contiguous
-        if len(shape) > 0 and iface.get("strides", None) is not None:
-            strides = [int(s) for s in iface['strides']]
-            if len(strides) != len(shape):
-                msg = "The length of shape and strides must be equal"
-                raise ValueError(msg)
-            s = itemsize
-            for i in reversed(range(len(shape))):
-                if s != strides[i]:
-                    raise ValueError("Array must be contiguous")
-                s *= shape[i]
-        if iface.get("mask", None) is not None:
-            raise NotImplementedError("mask attribute not supported")
-    else:
-        mview = memoryview(buffer)
-        data = _data_from_memoryview(mview)
-        nbytes = mview.nbytes
-        if not mview.contiguous:
-            raise ValueError("buffer must be contiguous")
-
-    if check_min_size is not None and nbytes < check_min_size:
+    cdef Array arr = Array(buffer)
+    if arr.cuda and not cuda_support:
+        msg = "UCX is not configured with CUDA support, please add " \
+              "`cuda_copy` and/or `cuda_ipc` to " \
+              "the UCX_TLS environment variable"
+        raise ValueError(msg)
+    if not arr.contiguous:
+        raise ValueError("Array must be contiguous")
+    if check_min_size is not None and arr.nbytes < check_min_size:
         raise ValueError("the nbytes is greater than the size of the buffer!")
-    return nbytes
+    return arr.nbytes
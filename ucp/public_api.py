@@ -1,9 +1,14 @@
 # Copyright (c) 2019, NVIDIA CORPORATION. All rights reserved.
 # See file LICENSE for terms.
 
+import asyncio
+import collections
 import os
+import time
+import weakref
 
 from ._libs import core
+from .exceptions import UCXBaseException, UCXCloseError
 
 # The module should only instantiate one instance of the application context
 # However, the init of CUDA must happen after all process forks thus we delay
@@ -24,7 +29,14 @@ def _get_ctx():
 # the functions here.
 
 
-def init(options={}, env_takes_precedence=False):
+def init(
+    options={},
+    env_takes_precedence=False,
+    progress_mode=None,
+    spin_time=None,
+    progress_budget=None,
+    num_workers=None,
+):
     """Initiate UCX.
 
     Usually this is done automatically at the first API call
@@ -38,6 +50,36 @@ def init(options={}, env_takes_precedence=False):
     env_takes_precedence: bool, optional
         Whether environment variables takes precedence over the `options`
         specified here.
+    progress_mode: str, optional
+        How the communication is progressed. "blocking" progresses it from
+        the event loop whenever UCX signals that there is work to do.
+        "spin" does the same but keeps polling UCX from the event loop for
+        `spin_time` seconds after the last progress, which lowers the
+        latency of back-to-back messages at the cost of CPU time.
+        "thread" progresses it in a background thread, with the GIL
+        released, that hands the completions to the event loop in batches,
+        which keeps transfers moving while the event loop runs Python code.
+        Default is the UCXPY_PROGRESS_MODE environment variable or
+        "blocking" if it isn't set.
+    spin_time: float, optional
+        The polling time in seconds of the "spin" progress mode.
+        Default is 1 millisecond.
+    progress_budget: int, optional
+        The maximum number of times UCX is progressed in one go by the
+        event loop before other tasks and timers get to run, the rest of
+        the work is continued afterwards. Zero means no limit.
+        Default is the UCXPY_PROGRESS_BUDGET environment variable or
+        zero if it isn't set.
+    num_workers: int, optional
+        The number of UCX workers of each event loop. Every event loop,
+        e.g. of every thread, gets workers of its own and the operations
+        of an endpoint only complete on the event loop it was created on.
+        Endpoints and listeners are assigned to the workers of their loop
+        round-robin, the endpoints accepted by a listener stay on its
+        worker. Each worker is progressed on its own, by the event loop
+        or, in the "thread" progress mode, by a thread of its own.
+        Default is the UCXPY_NUM_WORKERS environment variable or one if
+        it isn't set.
     """
     global _ctx
     if _ctx is not None:
@@ -50,7 +92,13 @@ def init(options={}, env_takes_precedence=False):
             if k in options:
                 del options[k]
 
-    _ctx = core.ApplicationContext(options)
+    _ctx = core.ApplicationContext(
+        options,
+        progress_mode=progress_mode,
+        spin_time=spin_time,
+        progress_budget=progress_budget,
+        num_workers=num_workers,
+    )
 
 
 def create_listener(callback_func, port=None):
@@ -94,8 +142,107 @@ async def create_endpoint(ip_address, port):
     return await _get_ctx().create_endpoint(ip_address, port)
 
 
+async def create_endpoints(addresses, concurrency=None, return_exceptions=False):
+    """Create new endpoints to many servers at once
+
+    The connections are set up together, the handshake with one server
+    doesn't wait for the previous one to finish.
+
+    Parameters
+    ----------
+    addresses: iterable of (str, int)
+        The IP address and port of each server
+    concurrency: int, optional
+        The maximum number of handshakes in flight at a time. Default
+        is no limit.
+    return_exceptions: bool, optional
+        If True, the exception of each failed connection is returned in
+        place of its endpoint. Otherwise, the endpoints that did connect
+        are closed and a UCXError listing the failures is raised.
+
+    Returns
+    -------
+    list of Endpoint
+        The new endpoints in the order of `addresses`
+    """
+    return await _get_ctx().create_endpoints(
+        addresses, concurrency=concurrency, return_exceptions=return_exceptions
+    )
+
+
+def connect(ip_address, port):
+    """Create a new endpoint to a server without an event loop
+
+    The endpoint is for the blocking API, e.g. `Endpoint.send_blocking()`,
+    which progresses UCX from the calling thread with the GIL released
+    while waiting. Each thread that calls `connect()` gets a UCX worker of
+    its own, thus the endpoint must only be used by the thread that
+    created it. The peer can be any listener, e.g. of an asyncio server.
+
+    Parameters
+    ----------
+    ip_address: str
+        IP address of the server the endpoint should connect to
+    port: int
+        IP address of the server the endpoint should connect to
+
+    Returns
+    -------
+    Endpoint
+        The new endpoint
+    """
+    return _get_ctx().connect(ip_address, port)
+
+
+def register_memory(buffer):
+    """Register the memory of `buffer` with UCX for remote access
+
+    The returned region keeps `buffer` alive and its remote key can be
+    shipped to a peer using `Endpoint.send_rkey()`, after which the peer
+    can access the memory using `Endpoint.put()` and `Endpoint.get()`.
+
+    Parameters
+    ----------
+    buffer: exposing the buffer protocol or array/cuda interface
+        The buffer to register. Raise ValueError if the buffer is read-only
+        since peers can write to the registered memory.
+
+    Returns
+    -------
+    MemoryRegion
+        The registered memory. When this object is deleted,
+        the memory is unregistered.
+    """
+    return MemoryRegion(_get_ctx().register_memory(buffer))
+
+
+def register_am_handler(am_id, callback):
+    """Register a handler of active messages with id `am_id`
+
+    The handler is called as `callback(header, payload, ep)` for every
+    active message sent to `am_id` using `Endpoint.am_send()`, thus no
+    receive has to be posted in advance. It is called on the event loop
+    once the message has arrived, in the "thread" progress mode after the
+    progress thread has handed the message over. `header` and `payload`
+    are read-only memoryviews of the received data, which UCX keeps for
+    the handler where it can rather than copying it. The views are only
+    valid during the call, copy what is needed afterwards. `ep` is the
+    Endpoint the message came from (or None if it isn't known). The
+    handler must not block; use e.g. `asyncio.ensure_future()` to start
+    longer work. The handlers are dropped by `reset()`.
+
+    Parameters
+    ----------
+    am_id: int
+        The active message id in the range [0, 65535]
+    callback: function or None
+        The handler. None removes the current handler.
+    """
+    _get_ctx().register_am_handler(am_id, callback)
+
+
 def progress():
-    """Try to progress the communication layer
+    """Try to progress the communication layer of the current event loop
 
     Returns
     -------
@@ -105,9 +252,25 @@ def progress():
     return _get_ctx().progress()
 
 
+def get_progress_stats():
+    """Returns counters of the progress of the communication layer
+    by the event loop as a dict, summed over all workers.
+
+    Returns
+    -------
+    dict
+        "progress_count": the number of times UCX was progressed,
+        "progress_calls": the number of UCX progress calls that made
+        progress and "budget_exhausted_count": the number of times
+        the progress stopped because it ran out of `progress_budget`.
+    """
+    return _get_ctx().get_progress_stats()
+
+
 def get_ucp_worker():
     """Returns the underlying UCP worker handle (ucp_worker_h)
-    as a Python integer.
+    as a Python integer, the first worker of the current event loop
+    if there are several.
     """
     return _get_ctx().get_ucp_worker()
 
@@ -137,13 +300,16 @@ def reset():
     The library is initiated at next API call.
     """
     global _ctx
+    if _ctx is not None:
+        _ctx.stop_progress_threads()
     _ctx = None
 
 
 class Listener:
     """A handle to the listening service started by `create_listener()`
 
-    The listening continues as long as this object exist or `.close()` is called.
+    The listening continues as long as this object exist or `.close()` is
+    called.
     Please use `create_listener()` to create an Listener.
     """
 
@@ -171,15 +337,86 @@ class Listener:
             self._closed = True
 
 
+class MemoryPool:
+    """A pool of host memory registered with UCX
+
+    Sending from and receiving into buffers of the pool avoids that UCX
+    has to register the memory on the fly, which is expensive for medium
+    and large messages. The pool hands out blocks of power-of-two size
+    classes between `min_block_size` and `slab_size`. Blocks are carved
+    off slabs of `slab_size` bytes one at a time, as needed, and a slab is
+    only mapped once the previous one is used up. Requests larger than
+    `slab_size` get their own registered region.
+
+    Parameters
+    ----------
+    slab_size: int, optional
+        The size of the memory regions registered with UCX
+    min_block_size: int, optional
+        The size of the smallest size class, at least 64 bytes
+    """
+
+    def __init__(self, slab_size=2 ** 24, min_block_size=2 ** 12):
+        self._b = _get_ctx().create_memory_pool(slab_size, min_block_size)
+
+    def allocate(self, nbytes):
+        """Returns a buffer of `nbytes` bytes from the pool.
+
+        The buffer exposes the buffer protocol and `__array_interface__` and
+        gives its memory back to the pool when it (and all views of it such
+        as `numpy.asarray(buffer)`) is deleted. Use `pool.allocate` as the
+        `allocator` of `Endpoint.recv_any()` to receive into pooled memory.
+
+        Parameters
+        ----------
+        nbytes: int
+            The size of the buffer in bytes
+        """
+        return self._b.allocate(nbytes)
+
+    @property
+    def nslabs(self):
+        """The number of slabs registered by the pool"""
+        return self._b.nslabs
+
+
+class MemoryRegion:
+    """A handle to memory registered with UCX
+
+    Please use `register_memory()` to create a MemoryRegion.
+    """
+
+    def __init__(self, backend):
+        self._b = backend
+
+    @property
+    def address(self):
+        """The address of the memory as a Python integer"""
+        return self._b.address
+
+    @property
+    def nbytes(self):
+        """The size of the memory in bytes"""
+        return self._b.length
+
+    def pack_rkey(self):
+        """Returns the packed remote key of the memory as bytes.
+
+        A peer unpacks it using `Endpoint.unpack_rkey()`.
+        """
+        return self._b.pack_rkey()
+
+
 class Endpoint:
     """An endpoint represents a connection to a peer
 
-    Please use `create_listener()` and `create_endpoint()`
+    Please use `create_listener()`, `create_endpoint()` or `connect()`
     to create an Endpoint.
     """
 
     def __init__(self, ep):
         self._ep = ep
+        self._channels = weakref.WeakValueDictionary()
 
     def __del__(self):
         if not self.closed():
@@ -198,17 +435,109 @@ class Endpoint:
         """
         await self._ep.signal_shutdown()
 
+    @property
+    def peer_info(self):
+        """What the peer told about itself when connecting, a dict of:
+
+        version: int
+            The version of the connection protocol
+        cuda_support: bool
+            Whether UCX of the peer is configured with CUDA support
+        max_eager_size: int
+            The size above which the peer sends messages by rendezvous,
+            zero if UCX picks it at runtime
+        progress_mode: str
+            The progress mode of the peer, see `init()`
+        peer_id: int
+            Identifies the process of the peer, the same for all of its
+            endpoints
+        """
+        return self._ep._peer_info
+
     def closed(self):
         """Is this endpoint closed?"""
         return self._ep._closed
 
-    def close(self):
+    def channel(self, n):
+        """Returns logical channel `n` of this endpoint.
+
+        A channel is an endpoint on the same connection with tags of its
+        own, messages sent on channel `n` are only received by channel `n`
+        of the peer, in order, whatever the other channels do. Thus
+        independent coroutines can send and receive concurrently on one
+        connection, each on a channel of its own. Channel 0 is this
+        endpoint itself.
+
+        Closing a channel cancels its operations in flight but leaves the
+        connection open, closing this endpoint closes all its channels.
+        `signal_shutdown()` and `flush()` act on the whole connection.
+
+        Parameters
+        ----------
+        n: int
+            The channel number, between 0 and 65534
+
+        Returns
+        -------
+        Endpoint
+            The channel, the same object for as long as it is in use
+        """
+        if n == 0:
+            return self
+        ret = self._channels.get(n)
+        if ret is None or ret.closed():
+            ret = Endpoint(self._ep.channel(n))
+            self._channels[n] = ret
+        return ret
+
+    def close(self, force=False):
         """Close this endpoint.
 
+        Returns at once, the operations still in flight are canceled and
+        the close completes in the background as the worker progresses.
+        Nothing waits for the close or reports whether it succeeded, use
+        `aclose()`, or `close_blocking()` for endpoints created by
+        `connect()`, for that.
+
         Notice, this functions doesn't signal the connected peer to shutdown
         To do that, use `Endpoint.signal_shutdown()`
+
+        Parameters
+        ----------
+        force: bool, optional
+            Tear the endpoint down without flushing it. The peer isn't
+            notified and data not yet delivered is lost, which is meant
+            for shutdown paths that don't care about either.
         """
-        return self._ep.close()
+        return self._ep.close(force=force)
+
+    async def aclose(self, force=False):
+        """Close this endpoint and wait for the close to complete.
+
+        Unless `force` is set, the endpoint is flushed first, see
+        `flush()`, thus the operations issued so far are delivered
+        before the endpoint is closed. Endpoints created by `connect()`
+        close with `close_blocking()` instead.
+
+        Parameters
+        ----------
+        force: bool, optional
+            Tear the endpoint down without flushing it, see `close()`.
+        """
+        await self._ep.aclose(force=force)
+
+    def close_blocking(self, force=False):
+        """Close this endpoint and wait for the close to complete.
+
+        Only for endpoints created by `connect()`, see `aclose()`
+        for the parameters.
+        """
+        self._ep.close_blocking(force=force)
+
+    async def flush(self):
+        """Wait for all operations issued on this endpoint so far to
+        complete, locally and at the peer."""
+        await self._ep.flush()
 
     async def send(self, buffer, nbytes=None):
         """Send `buffer` to connected peer.
@@ -217,7 +546,8 @@ class Endpoint:
         ----------
         buffer: exposing the buffer protocol or array/cuda interface
             The buffer to send. Raise ValueError if buffer is smaller
-            than nbytes.
+            than nbytes. Strided host arrays are sent without copying,
+            in C order, as if they were contiguous.
         nbytes: int, optional
             Number of bytes to send. Default is the whole buffer.
         """
@@ -230,12 +560,270 @@ class Endpoint:
         ----------
         buffer: exposing the buffer protocol or array/cuda interface
             The buffer to receive into. Raise ValueError if buffer
-            is smaller than nbytes or read-only.
+            is smaller than nbytes or read-only. Strided host arrays
+            are filled in C order, as if they were contiguous.
         nbytes: int, optional
             Number of bytes to receive. Default is the whole buffer.
         """
         await self._ep.recv(buffer, nbytes=nbytes)
 
+    def send_blocking(self, buffer, nbytes=None):
+        """Send `buffer` to connected peer and wait for it to finish.
+
+        Only for endpoints created by `connect()`, see `send()`
+        for the parameters.
+        """
+        self._ep.send_blocking(buffer, nbytes=nbytes)
+
+    def recv_blocking(self, buffer, nbytes=None):
+        """Receive from connected peer into `buffer` and wait for it
+        to finish.
+
+        Only for endpoints created by `connect()`, see `recv()`
+        for the parameters.
+        """
+        self._ep.recv_blocking(buffer, nbytes=nbytes)
+
+    async def recv_any(self, allocator=bytearray):
+        """Receive the next message from connected peer whatever its size.
+
+        Unlike `recv()`, the size of the message doesn't have to be known
+        in advance thus the peer doesn't need to send it first.
+
+        Parameters
+        ----------
+        allocator: callable, optional
+            Called as `allocator(nbytes)` to create the buffer the message
+            is received into. Default is `bytearray`. If it raises, the
+            exception is raised here and the message is discarded.
+
+        Returns
+        -------
+        buffer
+            The buffer created by `allocator` holding the message
+        """
+        return await self._ep.recv_any(allocator)
+
+    async def am_send(self, am_id, header, payload=b""):
+        """Send an active message to handler `am_id` of connected peer.
+
+        The peer handles the message in the handler registered using
+        `register_am_handler()`. Only host memory is supported.
+
+        Parameters
+        ----------
+        am_id: int
+            The id of the handler at the peer
+        header: exposing the buffer protocol or array interface
+            A (small) header passed to the handler
+        payload: exposing the buffer protocol or array interface, optional
+            The data passed to the handler
+        """
+        await self._ep.am_send(am_id, header, payload)
+
+    def unpack_rkey(self, packed_rkey):
+        """Unpack a remote key packed by the connected peer.
+
+        Parameters
+        ----------
+        packed_rkey: bytes
+            The remote key returned by the peer's `MemoryRegion.pack_rkey()`
+
+        Returns
+        -------
+        RemoteKey
+            The remote key to use with `put()` and `get()` on this endpoint.
+            It is destroyed when deleted or when this endpoint is closed.
+        """
+        return self._ep.unpack_rkey(packed_rkey)
+
+    async def send_rkey(self, region):
+        """Send the address, size and remote key of `region` to connected peer.
+
+        The peer receives them using `recv_rkey()`.
+
+        Parameters
+        ----------
+        region: MemoryRegion
+            The registered memory to give the peer access to
+        """
+        await self._ep.send_rkey(region._b)
+
+    async def recv_rkey(self):
+        """Receive a memory region sent by the peer using `send_rkey()`.
+
+        Returns
+        -------
+        tuple
+            The remote address, the size in bytes, and the unpacked
+            `RemoteKey` of the peer's memory region
+        """
+        return await self._ep.recv_rkey()
+
+    async def put(self, buffer, remote_addr, rkey, nbytes=None):
+        """Write `buffer` to the memory of connected peer at `remote_addr`.
+
+        This is a one-sided operation thus the peer takes no part in it.
+        Notice, the operation completes when `buffer` can be reused, which
+        doesn't imply that the data is visible at the peer yet.
+
+        Parameters
+        ----------
+        buffer: exposing the buffer protocol or array/cuda interface
+            The buffer to write. Raise ValueError if buffer is smaller
+            than nbytes.
+        remote_addr: int
+            The address of the peer's memory to write to
+        rkey: RemoteKey
+            The remote key of the peer's memory
+        nbytes: int, optional
+            Number of bytes to write. Default is the whole buffer.
+        """
+        await self._ep.put(buffer, remote_addr, rkey, nbytes=nbytes)
+
+    async def get(self, buffer, remote_addr, rkey, nbytes=None):
+        """Read the memory of connected peer at `remote_addr` into `buffer`.
+
+        This is a one-sided operation thus the peer takes no part in it.
+
+        Parameters
+        ----------
+        buffer: exposing the buffer protocol or array/cuda interface
+            The buffer to read into. Raise ValueError if buffer
+            is smaller than nbytes or read-only.
+        remote_addr: int
+            The address of the peer's memory to read from
+        rkey: RemoteKey
+            The remote key of the peer's memory
+        nbytes: int, optional
+            Number of bytes to read. Default is the whole buffer.
+        """
+        await self._ep.get(buffer, remote_addr, rkey, nbytes=nbytes)
+
+    def atomic_add(self, remote_addr, rkey, value):
+        """Atomically add `value` to the 64-bit word of connected peer
+        at `remote_addr`.
+
+        The add is posted without waiting for it to be applied at the peer.
+        Use `fetch_add()` to wait for the operation to complete.
+
+        Parameters
+        ----------
+        remote_addr: int
+            The address of the peer's 8-byte aligned 64-bit word
+        rkey: RemoteKey
+            The remote key of the peer's memory
+        value: int
+            The unsigned 64-bit value to add
+        """
+        self._ep.atomic_add(remote_addr, rkey, value)
+
+    async def fetch_add(self, remote_addr, rkey, value):
+        """Atomically add `value` to the 64-bit word of connected peer
+        at `remote_addr` and return the previous value of the word.
+
+        Parameters
+        ----------
+        remote_addr: int
+            The address of the peer's 8-byte aligned 64-bit word
+        rkey: RemoteKey
+            The remote key of the peer's memory
+        value: int
+            The unsigned 64-bit value to add
+
+        Returns
+        -------
+        int
+            The value of the word before the add
+        """
+        return await self._ep.fetch_add(remote_addr, rkey, value)
+
+    async def compare_swap(self, remote_addr, rkey, compare, swap):
+        """Atomically replace the 64-bit word of connected peer at
+        `remote_addr` by `swap` if the word equals `compare`.
+
+        Parameters
+        ----------
+        remote_addr: int
+            The address of the peer's 8-byte aligned 64-bit word
+        rkey: RemoteKey
+            The remote key of the peer's memory
+        compare: int
+            The value the word must have for the swap to happen
+        swap: int
+            The new value of the word
+
+        Returns
+        -------
+        int
+            The value of the word before the operation, which equals
+            `compare` if the swap happened
+        """
+        return await self._ep.compare_swap(remote_addr, rkey, compare, swap)
+
+    async def send_many(self, buffers):
+        """Send each buffer of `buffers` to connected peer.
+
+        The sends are posted together and complete as one operation,
+        which is much cheaper than a `send()` per buffer when sending
+        many small buffers. The peer must receive them in the same order,
+        e.g. using `recv_many()`.
+
+        Parameters
+        ----------
+        buffers: list
+            The buffers to send, one message per buffer. Each exposes the
+            buffer protocol or array/cuda interface. Strided host arrays
+            are sent without copying, as in `send()`.
+        """
+        await self._ep.send_many(buffers)
+
+    async def recv_many(self, buffers):
+        """Receive from connected peer into each buffer of `buffers`.
+
+        The receives are posted together and complete as one operation.
+        The i'th buffer receives the i'th message and must match its size.
+
+        Parameters
+        ----------
+        buffers: list
+            The buffers to receive into, each exposing the buffer protocol
+            or array/cuda interface. Raise ValueError, before any receive
+            is posted, if a buffer is read-only. Strided host arrays are
+            filled as in `recv()`.
+        """
+        await self._ep.recv_many(buffers)
+
+    async def send_iov(self, buffers):
+        """Send the buffers of `buffers` to connected peer as one message.
+
+        The buffers are gathered by UCX directly from their memory, thus no
+        concatenation copy is made. The peer receives the message using
+        `recv_iov()`.
+
+        Parameters
+        ----------
+        buffers: list
+            The buffers to send, each exposing the buffer protocol or
+            array/cuda interface.
+        """
+        await self._ep.send_iov(buffers)
+
+    async def recv_iov(self, buffers):
+        """Receive one message from connected peer scattered over `buffers`.
+
+        The message is written into the buffers in order. The total size
+        of `buffers` must match the size of the message sent.
+
+        Parameters
+        ----------
+        buffers: list
+            The buffers to receive into, each exposing the buffer protocol
+            or array/cuda interface. Raise ValueError if a buffer is
+            read-only.
+        """
+        await self._ep.recv_iov(buffers)
+
     def ucx_info(self):
         """Return low-level UCX info about this endpoint as a string"""
         return self._ep.ucx_info()
@@ -255,3 +843,215 @@ class Endpoint:
         as a Python integer.
         """
         return self._ucp_endpoint
+
+
+class ConnectionPool:
+    """A pool of endpoints to servers, keyed by their address
+
+    Connecting to a server costs a round trip, thus clients that talk to
+    the same servers over and over should take their endpoints from a
+    pool. `acquire()` returns an idle endpoint to the server if the pool
+    has one and otherwise creates a new one, `release()` gives it back to
+    the pool for reuse. Idle endpoints that are closed, e.g. because the
+    server signaled shutdown, are dropped. Endpoints that the pool lets go
+    of are shut down, see `Endpoint.signal_shutdown()`.
+
+    The endpoints belong to the UCX worker of the event loop that created
+    them, thus a pool must only be used from one event loop.
+
+    Parameters
+    ----------
+    max_size: int, optional
+        The maximum number of idle endpoints kept by the pool. When full,
+        the endpoint that has been idle the longest is shut down.
+    idle_timeout: float, optional
+        The number of seconds an endpoint is kept idle before it is shut
+        down. None keeps idle endpoints for as long as the pool has room.
+    health_check: coroutine function, optional
+        Called with an idle endpoint before it is handed out again. The
+        endpoint is dropped if it raises or returns False, e.g. pass
+        `Endpoint.flush` to check that the server is still reachable.
+    """
+
+    def __init__(self, max_size=64, idle_timeout=60.0, health_check=None):
+        if max_size < 0:
+            raise ValueError("max_size must be non-negative")
+        self._max_size = max_size
+        self._idle_timeout = idle_timeout
+        self._health_check = health_check
+        # The idle endpoints mapped to their address and the time they
+        # were released, the longest idle first
+        self._idle = collections.OrderedDict()
+        # The idle endpoints of each address, the most recently used last
+        self._by_address = {}
+        # The address of the endpoints acquired from the pool
+        self._acquired = weakref.WeakKeyDictionary()
+        # The shutdowns of endpoints let go of, still in flight
+        self._shutdowns = set()
+        # Expires the longest idle endpoint, armed while any is idle
+        self._timer = None
+        self._closed = False
+
+    def __len__(self):
+        """The number of idle endpoints in the pool"""
+        return len(self._idle)
+
+    def closed(self):
+        """Is the pool closed?"""
+        return self._closed
+
+    async def acquire(self, ip_address, port):
+        """Returns an endpoint to the server at `ip_address` and `port`.
+
+        Parameters
+        ----------
+        ip_address: str
+            IP address of the server
+        port: int
+            Port of the server's listener
+
+        Returns
+        -------
+        Endpoint
+            An idle endpoint of the pool or a new one
+        """
+        if self._closed:
+            raise UCXCloseError("acquire() - ConnectionPool closed")
+        self._expire()
+        address = (ip_address, port)
+        while address in self._by_address:
+            ep = self._pop(address)
+            if await self._is_healthy(ep):
+                self._acquired[ep] = address
+                return ep
+            self._shut_down(ep)
+        ep = await create_endpoint(ip_address, port)
+        self._acquired[ep] = address
+        return ep
+
+    def release(self, ep, reuse=True):
+        """Give an endpoint acquired from the pool back to it.
+
+        Parameters
+        ----------
+        ep: Endpoint
+            The endpoint, which mustn't be used after it is released
+        reuse: bool, optional
+            Whether the endpoint can be handed out again. Pass False for
+            endpoints in an unknown state, e.g. after an operation failed,
+            to shut them down instead.
+        """
+        try:
+            address = self._acquired.pop(ep)
+        except KeyError:
+            raise ValueError("the endpoint wasn't acquired from this pool")
+        if not reuse or self._closed or self._max_size == 0:
+            self._shut_down(ep)
+            return
+        if ep.closed():
+            return
+        self._idle[ep] = (address, time.monotonic())
+        self._by_address.setdefault(address, []).append(ep)
+        while len(self._idle) > self._max_size:
+            ep, (address, _) = next(iter(self._idle.items()))
+            self._remove(ep, address)
+            self._shut_down(ep)
+        self._expire()
+
+    def connection(self, ip_address, port):
+        """Acquire an endpoint for the body of an `async with` statement.
+
+        The endpoint is released when the body finishes and shut down if
+        the body raises::
+
+            async with pool.connection(ip_address, port) as ep:
+                await ep.send(msg)
+        """
+        return _PooledConnection(self, ip_address, port)
+
+    async def close(self):
+        """Shut down all idle endpoints and stop pooling. Endpoints that
+        are released afterwards are shut down."""
+        self._closed = True
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for ep in list(self._idle):
+            self._remove(ep, self._idle[ep][0])
+            self._shut_down(ep)
+        if self._shutdowns:
+            await asyncio.gather(*self._shutdowns)
+
+    def _pop(self, address):
+        ep = self._by_address[address][-1]
+        self._remove(ep, address)
+        return ep
+
+    def _remove(self, ep, address):
+        del self._idle[ep]
+        eps = self._by_address[address]
+        eps.remove(ep)
+        if not eps:
+            del self._by_address[address]
+
+    def _expire(self):
+        """Shut down the endpoints idle for longer than `idle_timeout` and
+        arm the timer for the next one"""
+        if self._idle_timeout is None:
+            return
+        deadline = time.monotonic() - self._idle_timeout
+        while self._idle:
+            ep, (address, since) = next(iter(self._idle.items()))
+            if since > deadline:
+                break
+            self._remove(ep, address)
+            self._shut_down(ep)
+        if self._idle and self._timer is None and not self._closed:
+            _, since = next(iter(self._idle.values()))
+            self._timer = asyncio.get_event_loop().call_later(
+                since - deadline, self._on_timer
+            )
+
+    def _on_timer(self):
+        self._timer = None
+        self._expire()
+
+    async def _is_healthy(self, ep):
+        if ep.closed():
+            return False
+        if self._health_check is None:
+            return True
+        try:
+            return await self._health_check(ep) is not False
+        except Exception:
+            return False
+
+    def _shut_down(self, ep):
+        if ep.closed():
+            return
+        task = asyncio.ensure_future(_signal_and_close(ep))
+        self._shutdowns.add(task)
+        task.add_done_callback(self._shutdowns.discard)
+
+
+async def _signal_and_close(ep):
+    try:
+        await ep.signal_shutdown()
+    except UCXBaseException:
+        pass
+    if not ep.closed():
+        ep.close()
+
+
+class _PooledConnection:
+    def __init__(self, pool, ip_address, port):
+        self._pool = pool
+        self._address = (ip_address, port)
+        self._ep = None
+
+    async def __aenter__(self):
+        self._ep = await self._pool.acquire(*self._address)
+        return self._ep
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._pool.release(self._ep, reuse=exc_type is None)